@@ -105,7 +105,7 @@ platform_pos = [
                  [-408.8, -564.1, 0.]
                ]
 
-#  todo  check this (can we calculate the following)?
+#  these can be calculated from the geometry, see workspace.py and USE_CALCULATED_LIMITS in platform_controller.py
 #  the max movement in a single DOF
 platform_1dof_limits = [100, 122, 140, math.radians(15), math.radians(20), math.radians(12)]
 
@@ -0,0 +1,221 @@
+""" filters
+
+low latency smoothing filters for the shape module
+
+Each filter smooths several axes at once, the state of all axes is held in
+numpy arrays so one call to next updates every axis.
+next takes an optional dt, the time in seconds since the previous update,
+so filter time constants stay the same if the update rate changes.
+group_delay returns the delay in seconds each filter adds at low frequencies.
+
+FilterBank combines filters of different types, one type per axis.
+"""
+
+import math
+import numpy as np
+from moving_average import MovingAverageArray
+
+FILTER_TYPES = ('ma', 'exp', 'butter', 'euro')  # names used in shape.cfg
+
+
+class ExponentialFilter(object):
+    """
+    first order low pass filter
+    """
+
+    def __init__(self, cutoffs, sample_period):
+        self.sample_period = sample_period
+        self.cutoffs = np.asarray(cutoffs, dtype=float)
+        self.y = None
+
+    def next(self, x, dt=None):
+        x = np.asarray(x, dtype=float)
+        if self.y is None:
+            self.y = x.copy()
+        else:
+            self.y += self._alpha(dt or self.sample_period) * (x - self.y)
+        return self.y.copy()
+
+    def group_delay(self):
+        alpha = self._alpha(self.sample_period)
+        return (1 - alpha) / alpha * self.sample_period
+
+    def _alpha(self, dt):
+        return 1 - np.exp(-2 * math.pi * self.cutoffs * dt)
+
+
+class ButterworthFilter(object):
+    """
+    second order butterworth low pass or high pass filter (biquad)
+    """
+
+    def __init__(self, cutoffs, sample_period, high_pass=False):
+        self.cutoffs = np.asarray(cutoffs, dtype=float)
+        self.high_pass = high_pass
+        self.sample_period = sample_period  # averaged time between updates
+        self._design(sample_period)
+        #  direct form I state, previous inputs and outputs stay valid when the coefficients change
+        self.x1 = None
+        self.x2 = None
+        self.y1 = None
+        self.y2 = None
+
+    def next(self, x, dt=None):
+        if dt is not None:
+            self.sample_period += 0.1 * (dt - self.sample_period)  # averaged so timer jitter is ignored
+            if abs(self.sample_period - self.design_period) > .05 * self.design_period:
+                self._design(self.sample_period)  # the update rate has changed
+        x = np.array(x, dtype=float)
+        if self.x1 is None:
+            #  start in steady state at the first value
+            self.x1 = x
+            self.x2 = x
+            self.y1 = x * self.dc_gain
+            self.y2 = self.y1
+        y = self.b0 * x + self.b1 * self.x1 + self.b2 * self.x2 - self.a1 * self.y1 - self.a2 * self.y2
+        self.x2 = self.x1
+        self.x1 = x
+        self.y2 = self.y1
+        self.y1 = y
+        return y.copy()
+
+    def group_delay(self):
+        #  group delay at zero frequency from the filter coefficients (low pass only)
+        b_sum = self.b0 + self.b1 + self.b2
+        a_sum = 1 + self.a1 + self.a2
+        samples = (self.b1 + 2 * self.b2) / b_sum - (self.a1 + 2 * self.a2) / a_sum
+        return samples * self.design_period
+
+    def _design(self, sample_period):
+        #  bilinear transform with frequency prewarping
+        self.design_period = sample_period
+        K = np.tan(math.pi * self.cutoffs * sample_period)
+        norm = 1 / (1 + math.sqrt(2) * K + K * K)
+        if self.high_pass:
+            self.b0 = norm
+            self.b1 = -2 * self.b0
+            self.dc_gain = 0.0
+        else:
+            self.b0 = K * K * norm
+            self.b1 = 2 * self.b0
+            self.dc_gain = 1.0
+        self.b2 = self.b0
+        self.a1 = 2 * (K * K - 1) * norm
+        self.a2 = (1 - math.sqrt(2) * K + K * K) * norm
+
+
+class OneEuroFilter(object):
+    """
+    adaptive first order low pass filter
+
+    the cutoff rises with speed so there is little lag on fast movements
+    and strong smoothing when nearly still, see: http://cristal.univ-lille.fr/~casiez/1euro/
+    """
+
+    def __init__(self, min_cutoffs, betas, sample_period, derivative_cutoff=1.0):
+        self.sample_period = sample_period
+        self.min_cutoffs = np.asarray(min_cutoffs, dtype=float)
+        self.betas = np.asarray(betas, dtype=float)
+        self.derivative_cutoff = derivative_cutoff
+        self.y = None
+        self.dy = None
+
+    def next(self, x, dt=None):
+        x = np.asarray(x, dtype=float)
+        dt = dt or self.sample_period
+        if self.y is None:
+            self.y = x.copy()
+            self.dy = np.zeros(len(x))
+        else:
+            self.dy += self._alpha(self.derivative_cutoff, dt) * ((x - self.y) / dt - self.dy)
+            alpha = self._alpha(self.min_cutoffs + self.betas * np.abs(self.dy), dt)
+            self.y += alpha * (x - self.y)
+        return self.y.copy()
+
+    def group_delay(self):
+        #  delay when still, this is the maximum delay
+        alpha = self._alpha(self.min_cutoffs, self.sample_period)
+        return (1 - alpha) / alpha * self.sample_period
+
+    def _alpha(self, cutoff, dt):
+        tau = 1 / (2 * math.pi * cutoff)
+        return 1 / (1 + tau / dt)
+
+
+class MovingAverageFilter(object):
+    """
+    MovingAverageArray with the same interface as the other filters
+
+    window lengths are in seconds, the number of samples averaged follows the update rate
+    """
+
+    def __init__(self, window_times, sample_period):
+        self.window_times = np.asarray(window_times, dtype=float)
+        self.sample_period = sample_period
+        self.moving_average = MovingAverageArray(self._sizes())
+
+    def next(self, x, dt=None):
+        if dt is not None:
+            self.sample_period += 0.1 * (dt - self.sample_period)  # averaged so jitter does not resize windows
+            sizes = self._sizes()
+            if np.any(sizes != self.moving_average.sizes):
+                self.moving_average.resize(sizes)
+        return self.moving_average.next(x)
+
+    def _sizes(self):
+        return np.maximum(np.round(self.window_times / self.sample_period).astype(int), 1)
+
+    def group_delay(self):
+        return (self.moving_average.sizes - 1) / 2.0 * self.sample_period
+
+
+class FilterBank(object):
+    """
+    applies a filter type to each axis
+
+    axes using the same type are filtered together
+    """
+
+    def __init__(self, types, ma_times, cutoffs, betas, sample_period):
+        self.filters = []  # list of (axis indices, filter)
+        for filter_type in FILTER_TYPES:
+            idx = np.array([i for i, t in enumerate(types) if t == filter_type], dtype=int)
+            if len(idx) == 0:
+                continue
+            if filter_type == 'ma':
+                f = MovingAverageFilter(np.take(ma_times, idx), sample_period)
+            elif filter_type == 'exp':
+                f = ExponentialFilter(np.take(cutoffs, idx), sample_period)
+            elif filter_type == 'butter':
+                f = ButterworthFilter(np.take(cutoffs, idx), sample_period)
+            else:
+                f = OneEuroFilter(np.take(cutoffs, idx), np.take(betas, idx), sample_period)
+            self.filters.append((idx, f))
+        self.nbr_axes = len(types)
+
+    def next(self, x, dt=None):
+        x = np.asarray(x, dtype=float)
+        y = x.copy()
+        for idx, f in self.filters:
+            y[idx] = f.next(x[idx], dt)
+        return y
+
+    def filter_frames(self, frames):
+        """
+        filters N x axes array of frames, state is updated as if next was called for each frame
+        """
+        frames = np.asarray(frames, dtype=float)
+        y = frames.copy()
+        for idx, f in self.filters:
+            if isinstance(f, MovingAverageFilter):
+                y[:, idx] = f.moving_average.filter_frames(frames[:, idx])
+            else:
+                for i in xrange(len(frames)):
+                    y[i, idx] = f.next(frames[i, idx])
+        return y
+
+    def group_delay(self):
+        delay = np.zeros(self.nbr_axes)
+        for idx, f in self.filters:
+            delay[idx] = f.group_delay()
+        return delay
@@ -8,7 +8,8 @@ Flags and Operands are enum classes just to keep track of various constants
 __autor__ = "Peter Magnusson"
 __copyright__ = "Copyright 2009-2010, Peter Magnusson <peter@birchroad.net>"
 __version__ = "1.0.0"
-__all__ = ['Flags', 'Operands', 'Factory', 'PayloadEncodingException', 'PayloadDecodingException', 'Packet']
+__all__ = ['Flags', 'Operands', 'Factory', 'PayloadEncodingException', 'PayloadDecodingException', 'Packet',
+           'FlagwordEncoder', 'ResponseDecoder']
 
 #Copyright (c) 2009-2010 Peter Magnusson.
 #All rights reserved.
@@ -39,12 +40,23 @@ __all__ = ['Flags', 'Operands', 'Factory', 'PayloadEncodingException', 'PayloadD
 #SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
-from struct import pack, unpack, calcsize
+from struct import Struct, error as StructError
 import logging
 import sys
 
 EASYIP_PORT=995
 
+_word_structs = {}
+
+def word_struct(count):
+    """
+    Cached Struct for a payload of 'count' words
+    """
+    s = _word_structs.get(count)
+    if s is None:
+        s = _word_structs[count] = Struct('<%dH' % count)
+    return s
+
 class Flags():
     """
     EasyIP flag enum
@@ -99,6 +111,18 @@ class Factory():
         assert count
         return packet
     
+    @classmethod
+    def send_req_flagword(cls, counter, words, send_offset, req_count, req_offset):
+        """
+        Send flagword(s) to be stored starting at flagword 'send_offset' and
+        request 'req_count' flagwords starting at flagword 'req_offset' in the same packet
+        """
+        packet = cls.send_flagword(counter, words, send_offset)
+        packet.reqdata_type=Operands.FLAG_WORD
+        packet.reqdata_size=req_count
+        packet.reqdata_offset_server = req_offset
+        return packet
+    
     @classmethod
     def req_flagword(cls, counter, count, offset=0):
         """
@@ -136,6 +160,55 @@ class Factory():
         packet.flags = Flags.RESPONSE
         return packet
 
+class FlagwordEncoder(object):
+    """
+    Fast path encoder for packets sent every frame
+
+    The header is packed once into a reusable bytearray, encode only
+    updates the counter and the flagword payload in place.
+    """
+    __slots__ = ['packet', 'buffer', 'send_count', '_view', '_words']
+
+    def __init__(self, send_count, send_offset=0, req_count=0, req_offset=0):
+        """
+        send_count flagwords are written starting at 'send_offset' and
+        'req_count' flagwords are requested starting at 'req_offset'
+        """
+        if send_count:
+            self.packet = Factory.send_flagword(0, [0] * send_count, send_offset)
+        else:
+            self.packet = Packet()
+        if req_count:
+            self.packet.reqdata_type = Operands.FLAG_WORD
+            self.packet.reqdata_size = req_count
+            self.packet.reqdata_offset_server = req_offset
+        self.send_count = send_count
+        self.buffer = bytearray(Packet.HEADER_SIZE + 2 * send_count)
+        self.packet.pack_header_into(self.buffer)
+        self._view = memoryview(self.buffer)
+        self._words = word_struct(send_count)
+
+    def encode(self, counter, words=None):
+        """
+        Returns the buffer holding the packet with the given counter and flagwords
+
+        words is a list or a little endian uint16 numpy array of send_count values,
+        the buffer is overwritten by the next call
+        """
+        self.packet.counter = counter
+        Packet.COUNTER.pack_into(self.buffer, Packet.COUNTER_OFFSET, counter)
+        if self.send_count:
+            if getattr(words, 'dtype', None) is not None and words.dtype.str == '<u2':
+                if words.size != self.send_count:
+                    raise PayloadEncodingException("Expected %d words" % self.send_count)
+                self._view[Packet.HEADER_SIZE:] = words.data #copy without conversion
+            else:
+                try:
+                    self._words.pack_into(self.buffer, Packet.HEADER_SIZE, *words)
+                except StructError:
+                    raise PayloadEncodingException("Word must be within 0 - 65535")
+        return self.buffer
+
 class PayloadEncodingException(Exception):
     pass
 
@@ -151,20 +224,24 @@ class Packet(object):
         'senddata_type', 'senddata_size', 'senddata_offset', 
         'spare2', 'reqdata_type', 'reqdata_size', 'reqdata_offset_server',
         'reqdata_offset_client']
+    __slots__ = _FIELDS + ['payload']
     DIRECTION_SEND=1
     DIRECTION_REQ=2
+    HEADER = Struct(HEADER_FORMAT)
+    HEADER_SIZE = HEADER.size
+    COUNTER = Struct('<H')
+    COUNTER_OFFSET = 2 #byte offset of the counter field
+    logger = logging.getLogger('fstlib.easyip')
    
     def __init__(self, data=None, **kwargs):
-        self.logger = logging.getLogger('fstlib.easyip')
         self.payload = None
-        for f in self._FIELDS:
-            setattr(self, f, 0)
-        
         if data:
-            self.logger.debug("len(data)=%d" % len(data))
+            self.logger.debug("len(data)=%d", len(data))
             self.unpack(data);
-            self.payload=data[calcsize(self.HEADER_FORMAT):]
+            self.payload=data[self.HEADER_SIZE:]
         else:
+            for f in self._FIELDS:
+                setattr(self, f, 0)
             for key in kwargs:
                 if key in Packet._FIELDS:
                     setattr(self,key, kwargs[key])
@@ -172,22 +249,27 @@ class Packet(object):
     def unpack(self, data):
         """Unpacks a packet comming in a string buffer"""
         self.logger.debug("Unpacking data")
-        data = unpack(self.HEADER_FORMAT, data[0:calcsize(self.HEADER_FORMAT)])
-        header=list(data)
-        index = 0
-        for f in self._FIELDS:
-            setattr(self, f, header[index])
-            index +=1
-            
-        self.logger.debug(self.__str__())
-        return header
+        header = self.HEADER.unpack_from(data)
+        (self.flags, self.error, self.counter, self.index1, self.spare1,
+         self.senddata_type, self.senddata_size, self.senddata_offset,
+         self.spare2, self.reqdata_type, self.reqdata_size, self.reqdata_offset_server,
+         self.reqdata_offset_client) = header
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(self.__str__())
+        return list(header)
     
+    def pack_header_into(self, buffer, offset=0):
+        """Packs the header into a writable buffer such as a bytearray"""
+        self.HEADER.pack_into(buffer, offset, self.flags, self.error, self.counter, self.index1, self.spare1,
+                              self.senddata_type, self.senddata_size, self.senddata_offset,
+                              self.spare2, self.reqdata_type, self.reqdata_size, self.reqdata_offset_server,
+                              self.reqdata_offset_client)
+
     def pack(self):
-        header = []
-        for f in self._FIELDS:
-            header.append(getattr(self, f, 0))
-            
-        packed_header = pack(self.HEADER_FORMAT, *header)
+        packed_header = self.HEADER.pack(self.flags, self.error, self.counter, self.index1, self.spare1,
+                                         self.senddata_type, self.senddata_size, self.senddata_offset,
+                                         self.spare2, self.reqdata_type, self.reqdata_size,
+                                         self.reqdata_offset_server, self.reqdata_offset_client)
         if self.payload and len(self.payload)>0:
             return packed_header + self.payload
         else:
@@ -216,14 +298,21 @@ class Packet(object):
                 count = 1
             else:
                 self.payload = None
+        elif hasattr(data, 'dtype'):
+            #numpy array, values are packed without conversion if already little endian uint16
+            if data.dtype.str != '<u2':
+                if data.size and (data.max()>65535 or data.min()<0): raise PayloadEncodingException("Word must be within 0 - 65535")
+                data = data.astype('<u2')
+            count = data.size
+            self.payload = data.tobytes()
         else:
             if not isinstance(data, list):
                 data = [data,]
-            for d in data:
-                if d>65535 or d<0: raise PayloadEncodingException("Word must be within 0 - 65535")
             count = len(data)
-            payload_format = '<' + "H "*count
-            self.payload = pack(payload_format, *data)
+            try:
+                self.payload = word_struct(count).pack(*data)
+            except StructError:
+                raise PayloadEncodingException("Word must be within 0 - 65535")
         return count
     
     def decode_payload(self, direction):
@@ -241,11 +330,11 @@ class Packet(object):
             strings.pop()
             return strings
         else:
-            payload_format = '<' + ("H " * count)
+            payload_struct = word_struct(count)
             try:
-                return unpack(payload_format, self.payload[:count*2])
+                return payload_struct.unpack_from(self.payload)
             except Exception as e:
-                raise PayloadDecodingException("Failed to decode payload with format='%s'" % payload_format, e), None, sys.exc_info()[2]
+                raise PayloadDecodingException("Failed to decode payload with format='%s'" % payload_struct.format, e), None, sys.exc_info()[2]
                 
     
     
@@ -260,4 +349,63 @@ class Packet(object):
         if len(errors)>0:
             return errors
         else:
-            return None
\ No newline at end of file
+            return None
+
+class ResponseDecoder(object):
+    """
+    Zero copy decoder for received packets
+
+    Packets are received into a reusable bytearray and the header is
+    unpacked from a memoryview of it, the payload is not copied.
+    Use payload_offset to make a view of the payload, e.g. with numpy.frombuffer,
+    the view is overwritten by each receive.
+    """
+    __slots__ = ['buffer', 'size', 'flags', 'error', 'counter', 'reqdata_type', 'reqdata_size', '_view']
+    payload_offset = Packet.HEADER_SIZE
+
+    def __init__(self, buffer_size=1024):
+        self.buffer = bytearray(buffer_size)
+        self._view = memoryview(self.buffer)
+        self.size = 0
+        self.flags = self.error = self.counter = self.reqdata_type = self.reqdata_size = 0
+
+    def receive(self, sock):
+        """
+        Receives and decodes one packet from socket 'sock', returns the sender address
+        """
+        nbytes, address = sock.recvfrom_into(self.buffer)
+        self.decode(nbytes)
+        return address
+
+    def decode(self, nbytes):
+        """
+        Decodes the header of the nbytes long packet in the buffer
+        """
+        if nbytes < Packet.HEADER_SIZE:
+            raise PayloadDecodingException("Packet of %d bytes is shorter than the header" % nbytes)
+        header = Packet.HEADER.unpack_from(self._view)
+        self.flags, self.error, self.counter = header[0:3]
+        self.reqdata_type, self.reqdata_size = header[9:11]
+        self.size = nbytes
+
+    def response_errors(self, counter):
+        """
+        Errors of the decoded packet as a response to the packet sent with 'counter', None if ok
+        """
+        errors = []
+        if self.flags != Flags.RESPONSE:
+            errors.append('not a response packet (flags=%i)' % self.flags)
+        if self.counter != counter:
+            errors.append('bad counter')
+        if self.error:
+            errors.append('error=%i' % self.error)
+        if len(errors)>0:
+            return errors
+        else:
+            return None
+
+    def payload_words(self):
+        """
+        Number of complete words in the payload
+        """
+        return (self.size - Packet.HEADER_SIZE) // 2
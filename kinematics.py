@@ -2,6 +2,9 @@
 
 finds actuator lengths L such that the platform is in position defined by
     a = [surge, sway, heave, roll, pitch yaw]
+
+forward_kinematics does the reverse, finding the platform position
+for given actuator lengths using Newton-Raphson iteration
 """
 
 import math
@@ -14,9 +17,19 @@ class Kinematics(object):
         pass
 
     def set_geometry(self, base_pos, platform_pos, platform_mid_height):
-        self.base_pos = base_pos
-        self.platform_pos = platform_pos
+        self.base_pos = np.asarray(base_pos, dtype=float)
+        self.platform_pos = np.asarray(platform_pos, dtype=float)
         self.platform_mid_height = platform_mid_height
+        #  everything below depends only on geometry and is reused by inverse_kinematics_rt
+        if platform_mid_height < 0:  # is fixed platform above moving platform
+            self._z_sign = -1.0  # invert z value on inverted stewart platform
+        else:
+            self._z_sign = 1.0
+        self._translation = np.zeros(3)  # work buffers
+        self._Rt = np.zeros((3, 3))  # transposed rotation matrix so platform_pos . Rt rotates all points
+        self._legs = np.zeros(self.platform_pos.shape)
+        self._lengths = np.zeros(len(self.platform_pos))  # default output buffer
+        self._fk_pose = np.zeros(6)  # previous forward kinematics solution used as warm start
 
     """ 
     returns numpy array of actuator lengths for given request orientation
@@ -30,7 +43,7 @@ class Kinematics(object):
             adj_req[2] = -adj_req[2]  # invert z value on inverted stewart platform
 
         #####adj_req[2] = self.platform_mid_height - adj_req[2]  # z axis displacement value is offset from center 
-        print "z = ", request[2], "adjusted z =:", adj_req[2]
+        # print "z = ", request[2], "adjusted z =:", adj_req[2]
         a = np.array(adj_req).transpose()
         roll = a[3]  # positive roll is right side down
         pitch = -a[4]  # positive pitch is nose down
@@ -60,3 +73,175 @@ class Kinematics(object):
         #  leg lengths are the length of the vector (xbar+uvw)
         L = np.sum(np.square(xbar + uvw), 1)
         return np.sqrt(L)
+
+    def inverse_kinematics_rt(self, request, out=None):
+        """
+        real time version of inverse_kinematics, returns actuator lengths in out
+
+        Uses the buffers allocated in set_geometry so no arrays are created per call.
+        If out is None the result is written to a buffer owned by this object
+        that is overwritten on the next call, copy it if it needs to be kept.
+        """
+        if out is None:
+            out = self._lengths
+        t = self._translation
+        t[0] = request[0]
+        t[1] = request[1]
+        t[2] = self._z_sign * (self.platform_mid_height + request[2])
+        roll = request[3]  # positive roll is right side down
+        pitch = -request[4]  # positive pitch is nose down
+        yaw = request[5]  # positive yaw is CCW
+        cos_roll = math.cos(roll)
+        sin_roll = math.sin(roll)
+        cos_pitch = math.cos(pitch)
+        sin_pitch = math.sin(pitch)
+        cos_yaw = math.cos(yaw)
+        sin_yaw = math.sin(yaw)
+        #  transpose of the 3-2-1 rotation matrix used in inverse_kinematics
+        Rt = self._Rt
+        Rt[0, 0] = cos_yaw*cos_pitch
+        Rt[1, 0] = cos_yaw*sin_pitch*sin_roll - sin_yaw*cos_roll
+        Rt[2, 0] = cos_yaw*sin_pitch*cos_roll + sin_yaw*sin_roll
+        Rt[0, 1] = sin_yaw*cos_pitch
+        Rt[1, 1] = sin_yaw*sin_pitch*sin_roll + cos_yaw*cos_roll
+        Rt[2, 1] = sin_yaw*sin_pitch*cos_roll - cos_yaw*sin_roll
+        Rt[0, 2] = -sin_pitch
+        Rt[1, 2] = cos_pitch*sin_roll
+        Rt[2, 2] = cos_pitch*cos_roll
+        legs = self._legs
+        np.dot(self.platform_pos, Rt, out=legs)  # orientation of platform wrt base
+        np.subtract(legs, self.base_pos, out=legs)
+        np.add(legs, t, out=legs)  # legs are now xbar + uvw
+        np.multiply(legs, legs, out=legs)
+        np.sum(legs, 1, out=out)
+        np.sqrt(out, out=out)
+        return out
+
+    def inverse_kinematics_batch(self, requests):
+        """
+        returns N x 6 numpy array of actuator lengths for N x 6 array of requests
+
+        All requests are solved in a single vectorized pass, use this for
+        offline work such as ride compilation and workspace sweeps
+        """
+        a = np.array(requests, dtype=float).reshape(-1, 6)  # copy, caller's array is not modified
+        a[:, 2] = self.platform_mid_height + a[:, 2]  # z axis displacement value is offset from center
+        if self.platform_mid_height < 0:  # is fixed platform above moving platform
+            a[:, 2] = -a[:, 2]  # invert z value on inverted stewart platform
+        Rzyx = self._rotation_matrices(a[:, 3], -a[:, 4], a[:, 5])  # N x 3 x 3
+        #  platform actuators points with respect to the base coordinate system, N x 6 x 3
+        xbar = a[:, np.newaxis, 0:3] - self.base_pos[np.newaxis, :, :]
+        #  orientation of platform wrt base, rotates each of the 6 platform points for all N requests
+        uvw = np.einsum('nij,kj->nki', Rzyx, self.platform_pos)
+        #  leg lengths are the length of the vector (xbar+uvw)
+        return np.sqrt(np.sum(np.square(xbar + uvw), 2))
+
+    @staticmethod
+    def _rotation_matrices(roll, pitch, yaw):
+        """
+        returns N x 3 x 3 array of 3-2-1 rotation matrices for arrays of angles
+        """
+        cos_roll = np.cos(roll)
+        sin_roll = np.sin(roll)
+        cos_pitch = np.cos(pitch)
+        sin_pitch = np.sin(pitch)
+        cos_yaw = np.cos(yaw)
+        sin_yaw = np.sin(yaw)
+        R = np.empty((len(roll), 3, 3))
+        R[:, 0, 0] = cos_yaw*cos_pitch
+        R[:, 0, 1] = cos_yaw*sin_pitch*sin_roll - sin_yaw*cos_roll
+        R[:, 0, 2] = cos_yaw*sin_pitch*cos_roll + sin_yaw*sin_roll
+        R[:, 1, 0] = sin_yaw*cos_pitch
+        R[:, 1, 1] = sin_yaw*sin_pitch*sin_roll + cos_yaw*cos_roll
+        R[:, 1, 2] = sin_yaw*sin_pitch*cos_roll - cos_yaw*sin_roll
+        R[:, 2, 0] = -sin_pitch
+        R[:, 2, 1] = cos_pitch*sin_roll
+        R[:, 2, 2] = cos_pitch*cos_roll
+        return R
+
+    def jacobian(self, request):
+        """
+        returns 6 x 6 numpy array of partial derivatives of actuator lengths wrt request
+
+        row i is the derivative of actuator i length, column j is request element j
+        """
+        return self._lengths_and_jacobian(request)[1]
+
+    def actuator_velocities(self, request, request_rate):
+        """
+        returns numpy array of actuator velocities for platform moving at request_rate
+
+        request_rate is rate of change of [x,y,z,roll,pitch,yaw] in mm and radians per second,
+        the returned velocities are in mm per second, negative when the actuator is shortening
+        """
+        return np.dot(self.jacobian(request), request_rate)
+
+    def forward_kinematics(self, lengths, guess=None, tolerance=0.01, max_iterations=10):
+        """
+        returns request [x,y,z,roll,pitch,yaw] that gives the 6 actuator lengths
+
+        Newton-Raphson on the leg length equations using the analytic jacobian.
+        The previous solution is used as the starting guess if none is given, at
+        control rate this converges in one or two iterations.
+        tolerance is the max actuator length error in mm.
+        returns None if no solution is found, the next call will then start from
+        the mid position.
+        The previous solution is only updated if guess is None, so calls with a
+        guess do not disturb the warm start of the per frame estimate.
+        """
+        warm_start = guess is None
+        if warm_start:
+            guess = self._fk_pose
+        pose = np.array(guess, dtype=float)
+        target = np.asarray(lengths, dtype=float)
+        for i in xrange(max_iterations):
+            L, J = self._lengths_and_jacobian(pose)
+            error = L - target
+            if np.max(np.abs(error)) < tolerance:
+                if warm_start:
+                    self._fk_pose = pose
+                return pose.copy()
+            try:
+                pose -= np.linalg.solve(J, error)
+            except np.linalg.LinAlgError:
+                break  # singular pose
+        if warm_start:
+            self._fk_pose = np.zeros(6)
+        return None
+
+    def _lengths_and_jacobian(self, request):
+        """
+        returns actuator lengths and jacobian (see jacobian method) for request
+        """
+        roll = request[3]
+        pitch = -request[4]
+        yaw = request[5]
+        cos_roll = math.cos(roll)
+        sin_roll = math.sin(roll)
+        cos_pitch = math.cos(pitch)
+        sin_pitch = math.sin(pitch)
+        cos_yaw = math.cos(yaw)
+        sin_yaw = math.sin(yaw)
+        #  Rzyx = Rz . Ry . Rx, derivatives are taken wrt each elementary rotation
+        Rx = np.array([[1, 0, 0], [0, cos_roll, -sin_roll], [0, sin_roll, cos_roll]])
+        Ry = np.array([[cos_pitch, 0, sin_pitch], [0, 1, 0], [-sin_pitch, 0, cos_pitch]])
+        Rz = np.array([[cos_yaw, -sin_yaw, 0], [sin_yaw, cos_yaw, 0], [0, 0, 1]])
+        dRx = np.array([[0, 0, 0], [0, -sin_roll, -cos_roll], [0, cos_roll, -sin_roll]])
+        dRy = np.array([[-sin_pitch, 0, cos_pitch], [0, 0, 0], [-cos_pitch, 0, -sin_pitch]])
+        dRz = np.array([[-sin_yaw, -cos_yaw, 0], [cos_yaw, -sin_yaw, 0], [0, 0, 0]])
+        RzRy = np.dot(Rz, Ry)
+        Rzyx = np.dot(RzRy, Rx)
+
+        t = np.array([request[0], request[1], self._z_sign * (self.platform_mid_height + request[2])])
+        legs = t + np.dot(self.platform_pos, Rzyx.T) - self.base_pos
+        L = np.sqrt(np.sum(np.square(legs), 1))
+        unit = legs / L[:, np.newaxis]  # unit vector along each leg
+
+        J = np.empty((6, 6))
+        J[:, 0] = unit[:, 0]
+        J[:, 1] = unit[:, 1]
+        J[:, 2] = self._z_sign * unit[:, 2]
+        J[:, 3] = np.sum(unit * np.dot(self.platform_pos, np.dot(RzRy, dRx).T), 1)
+        J[:, 4] = -np.sum(unit * np.dot(self.platform_pos, np.dot(np.dot(Rz, dRy), Rx).T), 1)  # request pitch is negated
+        J[:, 5] = np.sum(unit * np.dot(self.platform_pos, np.dot(dRz, np.dot(Ry, Rx)).T), 1)
+        return L, J
@@ -0,0 +1,50 @@
+""" latest value
+
+single slot mailbox passing the most recent value from one thread to another
+
+put overwrites any value not yet read so memory use is constant,
+the number of overwritten values is counted in dropped.
+Optionally a merge function combines an unread value with a new one,
+it returns the combined value and the number of items it discarded.
+"""
+
+import threading
+
+
+class LatestValue(object):
+
+    def __init__(self, merge=None):
+        self._lock = threading.Lock()
+        self._merge = merge
+        self._value = None
+        self.sequence = 0  # incremented by each put
+        self._read_sequence = 0
+        self.dropped = 0  # number of values overwritten before they were read
+
+    def put(self, value):
+        with self._lock:
+            if self.sequence != self._read_sequence:
+                if self._merge is None:
+                    self.dropped += 1
+                else:
+                    value, discarded = self._merge(self._value, value)
+                    self.dropped += discarded
+            self._value = value
+            self.sequence += 1
+
+    def get(self):
+        """
+        returns the most recent value, or None if nothing was put since the previous get
+        """
+        with self._lock:
+            if self.sequence == self._read_sequence:
+                return None
+            self._read_sequence = self.sequence
+            return self._value
+
+    def peek(self):
+        """
+        returns tuple of sequence number and most recent value without marking it read
+        """
+        with self._lock:
+            return self.sequence, self._value
@@ -0,0 +1,77 @@
+""" motion protocol
+
+binary UDP move messages, sent as an alternative to the text format "xyzrpy,x,y,z,r,p,y,\n"
+
+all values are little endian:
+  magic      2 bytes   'XB', text messages never start with this
+  version    uint8     PROTOCOL_VERSION
+  type       uint8     MSG_POSE or MSG_POSE_BATCH
+  sequence   uint32    incremented by the sender for each message, used to count lost messages
+  timestamp  double    sender time in seconds when the message was sent, used to measure latency
+then for MSG_POSE:
+  pose       6 doubles x,y,z,roll,pitch,yaw in the same units as the text format
+or for MSG_POSE_BATCH, used by clients sampling faster than they need to send:
+  count      uint16    number of samples
+  samples    count x 7 doubles, sender time in seconds followed by the pose of each sample
+"""
+
+import struct
+import numpy as np
+
+MAGIC = 'XB'
+PROTOCOL_VERSION = 1
+MSG_POSE = 1
+MSG_POSE_BATCH = 2
+
+HEADER = struct.Struct('<2sBBId')
+POSE = struct.Struct('<2sBBId6d')
+BATCH_COUNT = struct.Struct('<H')
+BATCH_SAMPLES_OFFSET = HEADER.size + BATCH_COUNT.size
+
+
+class MotionProtocolException(Exception):
+    pass
+
+
+def is_binary(data):
+    return data[:2] == MAGIC
+
+
+def encode_pose(sequence, timestamp, pose):
+    return POSE.pack(MAGIC, PROTOCOL_VERSION, MSG_POSE, sequence & 0xFFFFFFFF, timestamp, *pose)
+
+
+def encode_pose_batch(sequence, timestamp, samples):
+    """
+    samples is N x 7 array, each row is sample time followed by the pose
+    """
+    samples = np.asarray(samples, dtype='<f8')
+    return (HEADER.pack(MAGIC, PROTOCOL_VERSION, MSG_POSE_BATCH, sequence & 0xFFFFFFFF, timestamp) +
+            BATCH_COUNT.pack(len(samples)) + samples.tobytes())
+
+
+def decode(data):
+    """
+    returns tuple of message type, sequence, timestamp and values
+
+    values is a list of pose values for MSG_POSE, or
+    an N x 7 numpy array of sample times and poses for MSG_POSE_BATCH
+    """
+    if len(data) < HEADER.size:
+        raise MotionProtocolException("message too short")
+    magic, version, msg_type, sequence, timestamp = HEADER.unpack_from(data)
+    if version != PROTOCOL_VERSION:
+        raise MotionProtocolException("unsupported protocol version %d" % version)
+    if msg_type == MSG_POSE:
+        if len(data) < POSE.size:
+            raise MotionProtocolException("pose message too short")
+        return msg_type, sequence, timestamp, list(POSE.unpack_from(data)[5:])
+    if msg_type == MSG_POSE_BATCH:
+        if len(data) < BATCH_SAMPLES_OFFSET:
+            raise MotionProtocolException("batch message too short")
+        count = BATCH_COUNT.unpack_from(data, HEADER.size)[0]
+        if len(data) < BATCH_SAMPLES_OFFSET + count * 7 * 8:
+            raise MotionProtocolException("batch message too short for %d samples" % count)
+        samples = np.frombuffer(data, dtype='<f8', count=count * 7, offset=BATCH_SAMPLES_OFFSET)
+        return msg_type, sequence, timestamp, samples.reshape(count, 7)
+    raise MotionProtocolException("unknown message type %d" % msg_type)
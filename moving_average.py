@@ -1,9 +1,12 @@
 """ moving average
 
 from: https://github.com/kamyu104/LeetCode/blob/master/Python/moving-average-from-data-stream.py
+
+MovingAverageArray averages all axes in one step using a numpy ring buffer
 """
 
 from collections import deque
+import numpy as np
 
 
 class MovingAverage(object):
@@ -29,6 +32,88 @@ class MovingAverage(object):
         return 1.0 * self.__sum / len(self.__q)
 
 
+class MovingAverageArray(object):
+
+    def __init__(self, sizes, resum_interval=1000):
+        """
+        Moving average of several axes, each with its own window length.
+        :type sizes: list of int, window length of each axis, values less than 2 are not averaged
+        :type resum_interval: int, number of updates between recalculating sums from the buffer
+        """
+        self.sizes = np.maximum(np.asarray(sizes, dtype=int), 1)
+        self.__capacity = int(self.sizes.max())
+        self.__axes = np.arange(len(self.sizes))
+        self.__q = np.zeros((len(self.sizes), self.__capacity))  # ring buffer, one row per axis
+        self.__sum = np.zeros(len(self.sizes))
+        self.__index = 0  # buffer column for the next value
+        self.__count = 0  # number of values in buffer
+        self.__resum_interval = resum_interval
+        self.__updates = 0
+
+    def next(self, vals):
+        """
+        :type vals: list or numpy array with a value for each axis
+        :rtype: numpy array
+        """
+        vals = np.asarray(vals, dtype=float)
+        oldest = self.__q[self.__axes, (self.__index - self.sizes) % self.__capacity]
+        self.__sum += vals - np.where(self.__count >= self.sizes, oldest, 0)
+        self.__q[:, self.__index] = vals
+        self.__index = (self.__index + 1) % self.__capacity
+        self.__count = min(self.__count + 1, self.__capacity)
+        self.__updates += 1
+        if self.__updates >= self.__resum_interval:
+            self.__resum()
+        return self.__sum / np.minimum(self.__count, self.sizes)
+
+    def filter_frames(self, frames):
+        """
+        Averages a whole array of frames at once, state is updated as if next was called for each frame.
+        :type frames: N x axes array
+        :rtype: N x axes numpy array
+        """
+        frames = np.asarray(frames, dtype=float).reshape(-1, len(self.sizes))
+        nbr_frames = len(frames)
+        #  buffer in time order (oldest first) followed by the new frames, unused entries are zero
+        order = (self.__index + np.arange(self.__capacity)) % self.__capacity
+        values = np.hstack((self.__q[:, order], frames.T))
+        cumsum = np.zeros((len(self.sizes), values.shape[1] + 1))
+        np.cumsum(values, 1, out=cumsum[:, 1:])
+        end = self.__capacity + 1 + np.arange(nbr_frames)  # cumsum column after each new frame
+        start = end[np.newaxis, :] - self.sizes[:, np.newaxis]
+        sums = cumsum[:, end] - cumsum[self.__axes[:, np.newaxis], start]
+        counts = np.minimum(self.__count + 1 + np.arange(nbr_frames)[np.newaxis, :], self.sizes[:, np.newaxis])
+
+        self.__q[:] = values[:, -self.__capacity:]
+        self.__index = 0
+        self.__count = min(self.__count + nbr_frames, self.__capacity)
+        self.__resum()
+        return (sums / counts).T
+
+    def resize(self, sizes):
+        """
+        Changes the window lengths keeping the most recent values.
+        :type sizes: list of int, window length of each axis
+        """
+        order = (self.__index - self.__count + np.arange(self.__count)) % self.__capacity  # oldest first
+        recent = self.__q[:, order]
+        self.sizes = np.maximum(np.asarray(sizes, dtype=int), 1)
+        self.__capacity = int(self.sizes.max())
+        self.__q = np.zeros((len(self.sizes), self.__capacity))
+        keep = min(self.__count, self.__capacity)
+        self.__q[:, :keep] = recent[:, self.__count - keep:]
+        self.__index = keep % self.__capacity
+        self.__count = keep
+        self.__resum()
+
+    def __resum(self):
+        #  recalculate sums from buffer to remove accumulated rounding errors
+        newest_first = (self.__index - 1 - np.arange(self.__capacity)) % self.__capacity
+        in_window = np.arange(self.__capacity)[np.newaxis, :] < np.minimum(self.__count, self.sizes)[:, np.newaxis]
+        self.__sum = np.sum(self.__q[:, newest_first] * in_window, 1)
+        self.__updates = 0
+
+
 """
 obj = MovingAverage(4)
 while True:
@@ -11,6 +11,9 @@
       "config,units=mm_radians" <- sets angles as radians, self.is_normalized to False
       "config,units=mm_degrees" <- sets angles as degrees, self.is_normalized to False
   
+  Movement is extrapolated forward by the latency set with set_latency
+  to compensate for delays in smoothing and output (see predictor.py)
+
   Command messages are:
   "command,enable,\n"   : activate the chair for movement
   "command,disable,\n"  : disable movement and park the chair
@@ -26,6 +29,8 @@ from Queue import Queue
 import Tkinter as tk
 import traceback
 
+from predictor import PosePredictor
+
 
 class InputInterface(object):
     USE_GUI = True  # set True if using tkInter
@@ -52,6 +57,9 @@ class InputInterface(object):
         self.start_time = 0
  
         self.nbr_messages = 0
+        #  prediction model for each axis, see predictor.py
+        self.predictor = PosePredictor(['cv', 'cv', 'cv', 'cv', 'cv', 'cv'])
+        self.latency = 0.0  # seconds to extrapolate, single value or one for each axis
               
         self.rootTitle = "UDP Platform Interface"
         self.xyzrpyQ = Queue()
@@ -128,6 +136,11 @@ class InputInterface(object):
     def get_current_pos(self):
         return self.levels
 
+    def set_latency(self, latency):
+        # latency in seconds between receiving a message and platform movement
+        # e.g. smoothing delay plus festo round trip, can be a list with a value for each axis
+        self.latency = latency
+
     def intensity_status_changed(self, status):
         pass
 
@@ -137,26 +150,22 @@ class InputInterface(object):
         while self.cmdQ.qsize() > 0:
             cmd = self.cmdQ.get()
             self.process_command_msg(cmd)
-        # this logic assumes that incoming data rate is much higher then service rate
-        if self.xyzrpyQ.qsize() > 1: # need at least two messges
-            msg0 = []
-            msg1 = []
-            # throw away all but most recent two movement messages
-            while self.xyzrpyQ.qsize() > 1:
-                msg0 = self.xyzrpyQ.get()  
-            msg1 = self.xyzrpyQ.get() 
+        # every movement message is used to update the predictor, the prediction is sent once
+        received = False
+        while self.xyzrpyQ.qsize() > 0:
+            msg = self.xyzrpyQ.get()
             try:
-                data0 = self.extract_data(msg0[1])
-                data1 = self.extract_data(msg1[1])
-                delta = msg1[0] - msg0[0] 
-                if data0 != None and data1 != None:
-                    # print "incoming msg:", self.delta,  data1
-                    self.process_telemetry_msg(data0, data1, delta)
+                data = self.extract_data(msg[1])
+                if data != None:
+                    self.predictor.update(msg[0], data)
+                    received = True
             except:
                 #  print error if input not a string or cannot be converted into valid request
                 e = sys.exc_info()[0]
                 s = traceback.format_exc()
                 print e, s
+        if received:
+            self.process_telemetry()
 
     def extract_data(self, source):
         # this returns extacted data as list of floats(source also modified)
@@ -187,8 +196,17 @@ class InputInterface(object):
             e = sys.exc_info()[0]
             print "UDP svc err", e
     
-    def process_telemetry(self, data0, data1, delta):
-        print "todo process telemetry"
+    def process_telemetry(self):
+        r = list(self.predictor.predict(self.latency))
+        if self.is_normalized == False:
+            if self.angles_as_radians == False:
+                # convert to radians if received as degrees
+                r[3] = radians(r[3])
+                r[4] = radians(r[4])
+                r[5] = radians(r[5])
+        if self.move_func:
+            self.move_func(r)
+            self.levels = r
     
     def process_command_msg(self, msg):
         if msg is not None:
@@ -5,6 +5,7 @@ This version requires NoLimits attraction license and NL ver 2.5.3.4 or later
 
 import sys
 import time
+import threading
 import copy
 import Tkinter as tk
 import ttk
@@ -27,11 +28,18 @@ from platform_input_threadedUDP import InputInterface #  threaded UDP
 from kinematics import Kinematics
 from shape import Shape
 from platform_output import OutputInterface
+from workspace import Workspace, PoseLimiter
+from scheduler import TickScheduler
+from latest_value import LatestValue
 
 
 
 isActive = True  # set False to terminate
-frameRate = 0.05
+frameRate = 0.05  # seconds between control loop ticks
+guiFrameRate = 0.1  # seconds between GUI updates, the GUI runs on the main thread
+USE_CALCULATED_LIMITS = False  # set True to use limits calculated from the workspace instead of platform config
+USE_POSE_LIMITER = True  # move unreachable requests inside the workspace instead of clipping actuators
+USE_PREDICTION = False  # set True to extrapolate client requests by the smoothing delay and Festo round trip
 
 client = InputInterface()
 chair = OutputInterface()
@@ -42,10 +50,29 @@ class Controller:
 
     def __init__(self):
         self.prevT = 0
+        self.prev_request = None  # previous position request, used to calculate platform velocity
+        self.prev_move_time = 0  # time of the previous streamed move
+        self.prev_process_time = 0
+        self.dt = frameRate  # seconds between the two most recent requests
         self.is_output_enabled = False
+        self.estimated_pose = None  # platform pose calculated from Festo pressure readback
+        self.gui_snapshot = LatestValue()  # (position request, actuator lengths) of most recent move
+        self.output_lock = threading.Lock()  # held while a move or command changes the platform
         geometry = chair.get_geometry()
         k.set_geometry( geometry[0],geometry[1],geometry[2])
+        chair.set_kinematics(k)
+        min_len, max_len = chair.get_actuator_lengths()
+        self.workspace = Workspace(k, min_len, max_len)
+        if USE_POSE_LIMITER:
+            self.workspace.begin("workspace.npz")  # grid used by the limiter to check requests
+        else:
+            self.workspace.begin()
+        self.limiter = PoseLimiter(self.workspace)
+        print "calculated 1 dof limits", np.array(self.workspace.get_1dof_limits())
+        print "calculated 6 dof limits", np.array(self.workspace.get_6dof_limits())
         limits = chair.get_limits()
+        if USE_CALCULATED_LIMITS:
+            limits = self.workspace.get_1dof_limits()
         shape.begin(limits, "shape.cfg")
 
     def init_gui(self, root):
@@ -72,6 +99,9 @@ class Controller:
         return True
 
     def update_gui(self):
+        snapshot = self.gui_snapshot.get()
+        if snapshot is not None:
+            chair.show_muscles(snapshot[0], snapshot[1])
         self.root.update_idletasks()
         self.root.update()
 
@@ -130,11 +160,16 @@ class Controller:
 
     def process_request(self, request):
         #  print "in process", request
+        now = time.time()
+        self.dt = now - self.prev_process_time
+        self.prev_process_time = now
+        if self.dt <= 0 or self.dt > frameRate * 10:
+            self.dt = frameRate  # first request or requests have been paused
         if client.is_normalized:
             #  print "pre shape", request,
-            request = shape.shape(request)  # adjust gain & washout and convert from norm to real
+            request = shape.shape(request, self.dt)  # adjust gain & washout and convert from norm to real
             #  print "post",request
-        request = shape.smooth(request)
+        request = shape.smooth(request, self.dt)
         #  print ", after smoothing", request
         ##if self.is_output_enabled:
         return request
@@ -143,17 +178,37 @@ class Controller:
         #  position_requests are in mm and radians (not normalized)
         start = time.time()
         #  print "req= " + " ".join('%0.2f' % item for item in position_request)
-        actuator_lengths = k.inverse_kinematics(position_request)
-        chair.show_muscles(position_request, actuator_lengths)
-        if client.USE_GUI:   
-            controller.update_gui()
-        chair.move_platform(actuator_lengths)
+        if USE_POSE_LIMITER:
+            position_request = self.limiter.limit(position_request)
+        actuator_lengths = k.inverse_kinematics_rt(position_request)
+        if self.prev_request is None or start - self.prev_move_time > frameRate * 2 or chair.is_moving():
+            request_rate = np.zeros(6)  # streaming has restarted
+        else:
+            #  moves are made once per control tick, the nominal period has none of the timer jitter
+            request_rate = (position_request - self.prev_request) / frameRate
+        self.prev_request = np.array(position_request)
+        self.prev_move_time = start
+        actuator_velocities = k.actuator_velocities(position_request, request_rate)
+        chair.move_platform(actuator_lengths, actuator_velocities)
+        self.gui_snapshot.put((np.array(position_request), np.array(actuator_lengths)))
+        estimated_lengths = chair.get_estimated_lengths()
+        if estimated_lengths is not None:
+            self.estimated_pose = k.forward_kinematics(estimated_lengths)
 
         #  print "dur =",  time.time() - start, "interval= ",  time.time() - self.prevT
         #  self.prevT =  time.time()
 
     def cmd_func(self, cmd):  # command handler function called from Platform input
+        if cmd == "quit":
+            # prompts with tk msg box to confirm, the control thread keeps running while open
+            controller.quit()
+            return
+        with self.output_lock:
+            self.handle_command(cmd)
+
+    def handle_command(self, cmd):
         global isActive
+        self.prev_request = None  # the next streamed move does not continue from the previous one
         if cmd == "exit":
             isActive = False
         elif cmd == "enable":
@@ -173,21 +228,38 @@ class Controller:
              controller.park_platform(True)
         elif cmd == "unparkPlatform":
              controller.park_platform(False)
-        elif cmd == "quit":
-            # prompts with tk msg box to confirm 
-            controller.quit() 
 
     def move_func(self, request):  # move handler to position platform as requested by Platform input
         #  print "request is trans/rot list:", request
         try:
             request = np.array(request)
-            r = controller.process_request(request)
-            controller.move(r)
+            with self.output_lock:
+                r = controller.process_request(request)
+                controller.move(r)
         except:
             e = sys.exc_info()[0]  # report error
             s = traceback.format_exc()
             print e, s
 
+    def control_loop(self):
+        #  runs on its own thread so output timing does not depend on the GUI
+        scheduler = TickScheduler(frameRate)
+        while isActive:
+            scheduler.wait()
+            try:
+                if USE_PREDICTION:
+                    # the client extrapolates requests by the time they take to reach the platform
+                    client.set_latency(np.add(shape.get_smoothing_delay(), chair.get_round_trip()))
+                client.service_motion()
+                with self.output_lock:
+                    lengths = chair.service()  # idle, ready and swell moves
+                if lengths is not None:
+                    self.gui_snapshot.put((np.zeros(6), lengths))
+            except:
+                e = sys.exc_info()[0]  # report error
+                s = traceback.format_exc()
+                print e, s
+
 controller = Controller()
 
 
@@ -206,25 +278,29 @@ def main():
         s = traceback.format_exc()
         print e, s        
 
-    previous = time.time()
+    scheduler = TickScheduler(guiFrameRate, spin_time=0)  # GUI timing does not need to be precise
     chair_status = None
     if client.begin(controller.cmd_func, controller.move_func, chair.get_limits()) == False: 
         return  # exit if client forces exit
 
     ###client.service()
     ###controller.disable_platform()
+    control_thread = threading.Thread(target=controller.control_loop)
+    control_thread.daemon = True
+    control_thread.start()
     print "starting main service loop"
     while isActive:
-        if client.USE_GUI:         
+        #  commands and the GUI are serviced here, movement is serviced by the control thread
+        if not scheduler.wait(client.command_event):
+            client.service_commands()  # woken early by a command
+            continue
+        client.service_commands()
+        if client.USE_GUI:
             controller.update_gui()
-        if(time.time() - previous >= frameRate *.99):
-            #  print format("Frame duration = %.1f" % ((time.time() - previous)*1000))
-            previous = time.time()
-            if chair_status != chair.get_output_status():
-                chair_status = chair.get_output_status()
-                client.chair_status_changed(chair_status)
-            client.service()
-            #  print format("in controller, service took %.1f ms" % ((time.time() - previous) * 1000))
+        if chair_status != chair.get_output_status():
+            chair_status = chair.get_output_status()
+            client.chair_status_changed(chair_status)
+    control_thread.join()
 
 if __name__ == "__main__":
     main()
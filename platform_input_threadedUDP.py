@@ -3,9 +3,25 @@
 
   Receives UDP messages on port 10009
   Move messages are: "xyzrpy,x,y,z,r,p,y,\n"
+  or the binary format in motion_protocol.py, the format is detected for each message
+  binary messages can carry a batch of timestamped samples from high rate clients
   xyz are translations in mm, rpy are rotations in radians
   however if self.is_normalized is set True, range for all fields is -1 to +1
   
+  Move messages are timestamped on arrival and resampled at the time service
+  is called (see resampler.py), so the rate of service calls does not need
+  to match the rate messages are sent. Each service call uses the mean pose
+  since the previous call, so all samples of a high rate client are used.
+  Binary messages are timestamped with the sender's clock, offset by the
+  smallest delay seen so far, so network jitter does not change the sample intervals.
+
+  If the controller enables prediction the resampled pose is extrapolated by
+  the latency set with set_latency (see predictor.py), the extrapolation is
+  limited to predictor.max_latency seconds and max_offset from the latest pose.
+
+  service_motion moves the platform and can be called from a control thread,
+  service_commands handles commands and the GUI and is called from the Tk thread.
+
   Command messages are:
   "command,enable,\n"   : activate the chair for movement
   "command,disable,\n"  : disable movement and park the chair
@@ -23,11 +39,16 @@ import traceback
 import ctypes
 from ctypes import wintypes
 import time
+import numpy as np
 
 import pyautogui as pyautogui
 
 from serial_remote import SerialRemote
 import keys
+from resampler import PoseResampler
+from predictor import PosePredictor
+from latest_value import LatestValue
+import motion_protocol
 
 class InputInterface(object):
     USE_GUI = True  # set True if using tkInter
@@ -45,8 +66,27 @@ class InputInterface(object):
             print 'Platform Input is UDP with realworld parameters'
         self.levels = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
         self.rootTitle = "UDP Platform Interface"
-        self.inQ = Queue()
-        t = threading.Thread(target=self.listener_thread, args=(self.inQ, self.HOST, self.PORT))
+        # 'linear' or 'cubic', rotations only use slerp if values are angles (not normalized)
+        # capacity holds the samples of a 1 kHz client over the resampler delay and a control tick
+        self.resampler = PoseResampler(capacity=256, interpolation='linear', slerp=not self.is_normalized)
+        self.stale_time = 0.5  # stop moving if no message received for this many seconds
+        if self.is_normalized:
+            max_offset = [.2] * 6
+        else:
+            max_offset = [40, 40, 40, .1, .1, .1]  # mm and radians
+        # 'none', 'cv', 'ca' or 'kalman' for each axis
+        self.predictor = PosePredictor(['cv'] * 6, max_latency=0.2, max_offset=max_offset)
+        self.latency = 0.0  # seconds the pose is extrapolated, 0 disables prediction, see set_latency
+        self.clock_offset = None  # receive time less sender time of binary messages, see listener_thread
+        self.prev_motion_time = None  # time of the previous pose passed to move_func
+        # move samples not yet read by service as (timestamps, poses)
+        self.xyzrpy = LatestValue(merge=self._merge_samples)
+        self.cmdQ = Queue()  # commands are kept in order
+        self.command_event = threading.Event()  # set when a command is received
+        self.last_sequence = None  # sequence number of most recent binary message
+        self.lost_messages = 0  # binary messages missing from the sequence
+        self.message_latency = 0.0  # seconds from binary message sent to received, if on the same PC
+        t = threading.Thread(target=self.listener_thread, args=(self.HOST, self.PORT))
         t.daemon = True
         t.start()
         actions = {'detected remote': self.detected_remote, 'activate': self.activate,
@@ -87,44 +127,66 @@ class InputInterface(object):
     def get_current_pos(self):
         return self.levels
 
+    def set_latency(self, latency):
+        # latency in seconds between receiving a message and platform movement
+        # e.g. smoothing delay plus festo round trip, can be a list with a value for each axis
+        self.latency = latency
+
     def intensity_status_changed(self, status):
         pass
 
     def service(self):
-        self.RemoteControl.service()
+        # commands and movement serviced from one thread
+        self.service_commands()
+        self.service_motion()
+
+    def service_motion(self):
+        # called from the control thread at the control rate, does not use the GUI
         # move request returns translations as mm and angles as radians
-        msg = None
-        # throw away all but most recent message
-        while not self.inQ.empty():
-            msg = self.inQ.get()
-        try:
-            if msg is not None:
+        # the most recent move message is added to the resampler
+        move = self.xyzrpy.get()
+        if move is not None:
+            self.resampler.add_batch(move[0], move[1])
+            if np.any(self.latency):
+                for timestamp, pose in zip(move[0], move[1]):
+                    self.predictor.update(timestamp, pose)
+        now = time.time()
+        latest = self.resampler.latest_time()
+        if latest is not None and now - latest < self.stale_time:
+            if self.prev_motion_time is None or now - self.prev_motion_time > self.stale_time:
+                r = self.resampler.sample(now)
+            else:
+                r = self.resampler.average(self.prev_motion_time, now)
+            self.prev_motion_time = now
+            if np.any(self.latency):
+                # move the resampled pose by the distance the predictor expects to be moved during the latency
+                r += self.predictor.predict(self.latency) - self.predictor.predict(0.0)
+            r = list(r)
+            if self.move_func:
+                # print r
+                self.move_func(r)
+                self.levels = r
+
+    def service_commands(self):
+        # process received commands in order, called from the GUI thread
+        self.RemoteControl.service()
+        while not self.cmdQ.empty():
+            msg = self.cmdQ.get()
+            try:
                 msg = msg.rstrip()
                 # print msg
                 fields = msg.split(",")
                 field_list = list(fields)
-                if field_list[0] == "xyzrpy":
-                    # self.msg_label.config(text="got: " + msg)
-                    try:
-                        r = [float(f) for f in field_list[1:7]]
-                        # remove next 3 lines if angles passed as radians 
-                        if self.move_func:
-                            # print r
-                            self.move_func(r)
-                            self.levels = r
-                    except:  # if not a list of floats, process as command
-                        e = sys.exc_info()[0]
-                        print "UDP svc err", e
-                elif field_list[0] == "command":
+                if field_list[0] == "command":
                     print "command is {%s}:" % (field_list[1])
                     self.cmd_label.config(text="Most recent command: " + field_list[1])
                     if self.cmd_func:
                         self.cmd_func(field_list[1])
-        except:
-            #  print error if input not a string or cannot be converted into valid request
-            e = sys.exc_info()[0]
-            s = traceback.format_exc()
-            print e, s
+            except:
+                #  print error if input not a string or cannot be converted into valid request
+                e = sys.exc_info()[0]
+                s = traceback.format_exc()
+                print e, s
 
     def detected_remote(self, info):
         print info
@@ -172,13 +234,23 @@ class InputInterface(object):
         self.cmd_func(intensity)
         print "intensity ", intensity
 
-    def listener_thread(self, inQ, HOST, PORT):
+    def get_dropped_count(self):
+        # number of move samples discarded because service did not read them in time
+        return self.xyzrpy.dropped
+
+    def _merge_samples(self, unread, new):
+        # combines samples not yet read with new samples, keeping as many as the resampler holds
+        timestamps = np.concatenate((unread[0], new[0]))
+        poses = np.vstack((unread[1], new[1]))
+        discarded = max(len(timestamps) - len(self.resampler.times), 0)
+        return (timestamps[discarded:], poses[discarded:]), discarded
+
+    def listener_thread(self, HOST, PORT):
         try:
             self.MAX_MSG_LEN = 1024
             client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             client.bind((HOST, PORT))
             print "opening socket on", PORT
-            self.inQ = inQ
         except:
             e = sys.exc_info()[0]
             s = traceback.format_exc()
@@ -186,7 +258,40 @@ class InputInterface(object):
         while True:
             try:
                 msg = client.recv(self.MAX_MSG_LEN)
-                self.inQ.put(msg)
+                timestamp = time.time()  # used by resampler
+                if motion_protocol.is_binary(msg):
+                    try:
+                        msg_type, sequence, sent_time, values = motion_protocol.decode(msg)
+                        # the smallest delay is the best estimate of the clock offset, it follows drift slowly
+                        offset = timestamp - sent_time
+                        if self.clock_offset is None or offset < self.clock_offset:
+                            self.clock_offset = offset
+                        else:
+                            self.clock_offset += 0.001 * (offset - self.clock_offset)
+                        if msg_type == motion_protocol.MSG_POSE_BATCH:
+                            # sample times are in sender clock
+                            self.xyzrpy.put((values[:, 0] + self.clock_offset, values[:, 1:]))
+                        else:
+                            self.xyzrpy.put((np.array([sent_time + self.clock_offset]), np.array([values])))
+                        if self.last_sequence is not None and sequence > self.last_sequence + 1:
+                            self.lost_messages += sequence - self.last_sequence - 1
+                        self.last_sequence = sequence
+                        self.message_latency = timestamp - sent_time
+                    except motion_protocol.MotionProtocolException as e:
+                        print "UDP listener err,", e
+                elif msg.find("xyzrpy") == 0:
+                    fields = msg.rstrip().split(",")
+                    try:
+                        values = [float(f) for f in fields[1:7]]
+                    except ValueError:
+                        values = []
+                    if len(values) == 6:
+                        self.xyzrpy.put((np.array([timestamp]), np.array([values])))
+                    else:
+                        print "UDP listener err, invalid move message", msg
+                else:
+                    self.cmdQ.put(msg)
+                    self.command_event.set()  # wake main loop to process command
             except:
                 e = sys.exc_info()[0]
                 s = traceback.format_exc()
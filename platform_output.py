@@ -8,6 +8,8 @@ Muscle calculations use the following formula to convert % contraction to pressu
   pressure = 35 * percent*percent + 15 * percent + .03  # assume 25 Newtons for now
 percent is calculated as follows:
  percent =  1- (distance + MAX_MUSCLE_LEN - MAX_ACTUATOR_LEN)/ MAX_MUSCLE_LEN
+If USE_PRESSURE_TABLE is set the pressure is instead looked up in a calibrated table
+of contraction, load and velocity (see pressure_table.py)
 """
 
 import sys
@@ -16,8 +18,11 @@ import traceback
 import math
 import time
 import copy
+import threading
 import numpy as np
 from output_gui import OutputGui
+from trajectory import TrajectoryEngine
+from pressure_table import PressureTable
 #  import matplotlib.pyplot as plt    #  only for testing
 
 TESTING = False
@@ -34,8 +39,16 @@ from ConfigV2 import *
 #  from ConfigServoSimChair import *
 
 PRINT_MUSCLES = False
+USE_VELOCITY_FEED_FORWARD = False  # add pressure proportional to actuator velocity passed to move_platform
+VELOCITY_FEED_FORWARD_GAIN = 0.5  # bar per meter per second of muscle contraction
+TRANSITION_PROFILE = 'min_jerk'  # velocity profile of idle, ready and swell moves, see trajectory.py
+USE_PRESSURE_TABLE = True  # use the calibrated pressure table if one is found instead of the polynomial
+PRESSURE_TABLE_FNAME = "pressure_table.npz"  # built by running pressure_table.py
+TRANSITIONS_IN_POSE_SPACE = True  # interpolate transitions through kinematics, False for actuator space
 PRINT_PRESSURE_DELTA = True
-WAIT_FESTO_RESPONSE = False #True
+WAIT_FESTO_RESPONSE = False #True  # request pressure readback each frame, responses are received on a background thread
+COMBINED_FESTO_READBACK = True  # send pressures and request readback in one packet, False sends two packets
+FESTO_RESPONSE_TIMEOUT = 0.5  # seconds before a request with no response is counted as lost
 OLD_FESTO_CONTROLLER = False
 
 if TESTING:
@@ -75,13 +88,39 @@ class OutputInterface(object):
         self.platform_winddown_pos = np.empty(6)  # position for attaching stairs
         self.platform_winddown_pos.fill(WINDDOWN_LEN)
         self.isEnabled = False  # platform disabled if False
+        self.trajectory = TrajectoryEngine(profile=TRANSITION_PROFILE)  # idle, ready and swell moves, played by service
+        self.lengths = self.platform_disabled_pos.copy()  # actuator lengths most recently sent
         self.loaded_weight = PLATFORM_UNLOADED_WEIGHT + DEFAULT_PAYLOAD_WEIGHT
-        self.prev_pos = [0, 0, 0, 0, 0, 0]  # requested distances stored here
-        self.requested_pressures = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
-        self.actual_pressures = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
-        self.pressure_percent = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        self.pressure_table = None
+        if USE_PRESSURE_TABLE:
+            try:
+                self.pressure_table = PressureTable.load(PRESSURE_TABLE_FNAME)
+                print "using pressure table", PRESSURE_TABLE_FNAME
+            except (IOError, KeyError, ValueError):
+                #  the default table matches the polynomial, which is faster to calculate
+                print "unable to load", PRESSURE_TABLE_FNAME, "using the pressure polynomial"
+        self.prev_pos = np.zeros(6)  # requested muscle lengths stored here
+        #  flagword values (millibar) sent to the Festo, this buffer is reused every frame
+        self.pressure_buffer = np.zeros(6, dtype='<u2')
+        self.requested_pressures = self.pressure_buffer
+        self.actual_pressures = np.zeros(6, dtype='<u2')  # millibar read back from the Festo
+        self.compared_pressures = np.zeros(6, dtype='<u2')  # requested millibar of the packet answered by actual_pressures
+        self.pressure_delta = np.zeros(6, dtype=np.int32)  # actual - requested millibar
+        self.pressure_percent = np.zeros(6, dtype=np.int32)  # delta as percent of requested
+        #  most recent pressures received from the Festo, written by the receiver thread and read by _get_pressure
+        self.readback = np.zeros(6, dtype='<u2')
+        self.readback_requested = np.zeros(6, dtype='<u2')  # pressures requested by the packet answered by readback
+        self.readback_sequence = 0  # incremented by each readback received
+        self.readback_read_sequence = 0  # readback_sequence when _get_pressure last returned pressures
+        self.readback_lock = threading.Lock()
         self.prev_time = time.clock()
         self.netlink_ok = False # True if festo responds without error
+        self.counter = 0  # EasyIP counter of the most recent packet, responses are matched by counter
+        #  send time, True if readback requested and the requested pressures, of packets waiting for a response keyed by counter
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.lost_responses = 0  # requests with no response within FESTO_RESPONSE_TIMEOUT
+        self.round_trip = 0.0  # smoothed seconds from sending a packet to receiving its response
         if IS_SERIAL:
             #  configure the serial connection
             try:
@@ -94,7 +133,19 @@ class OutputInterface(object):
             self.FST_addr = (FST_ip, FST_port)         
             if not OLD_FESTO_CONTROLLER:
                 self.FSTs.bind(('0.0.0.0', 0))
-                self.FSTs.settimeout(1)  # timout after 1 second if no response
+                self.FSTs.settimeout(1)  # receiver thread timout after 1 second if no response
+                #  packets sent every frame are encoded in place into reused buffers
+                self.send_encoder = easyip.FlagwordEncoder(6)
+                self.send_req_encoder = easyip.FlagwordEncoder(6, 0, 6, 10)  # see _request_pressure
+                self.req_encoder = easyip.FlagwordEncoder(0, req_count=6, req_offset=10)
+                #  responses are received into a reused buffer, the payload is read through a numpy view
+                self.decoder = easyip.ResponseDecoder(bufSize)
+                self.response_words = np.frombuffer(self.decoder.buffer, dtype='<u2', count=6,
+                                                    offset=self.decoder.payload_offset)
+                self.is_receiving = True
+                t = threading.Thread(target=self._receiver_thread)
+                t.daemon = True
+                t.start()
         print ""
         self.prevMsg = []
         self.use_gui = False # defualt is no gui
@@ -116,6 +167,7 @@ class OutputInterface(object):
                 pass
         else:
             if not TESTING:
+                self.is_receiving = False
                 self.FSTs.close()
                 
     def get_platform_name(self):
@@ -127,6 +179,13 @@ class OutputInterface(object):
         """
         return base_pos, platform_pos, self.platform_mid_height 
 
+    def set_kinematics(self, kinematics):
+        """
+        kinematics used to interpolate idle, ready and swell moves in pose space
+        """
+        if TRANSITIONS_IN_POSE_SPACE:
+            self.trajectory.set_kinematics(kinematics)
+
     def get_actuator_lengths(self):
         return MIN_ACTUATOR_LEN, MAX_ACTUATOR_LEN
 
@@ -181,6 +240,24 @@ class OutputInterface(object):
         """
         return self.LIMITS
 
+    def get_round_trip(self):
+        """
+        return smoothed seconds between sending a packet to the Festo and receiving its response
+
+        returns 0 if no responses have been received
+        """
+        return self.round_trip
+
+    def get_estimated_lengths(self):
+        """
+        return numpy array of actuator lengths estimated from Festo pressure readback
+
+        returns None if readback is not enabled or the pressures are not valid
+        """
+        if not WAIT_FESTO_RESPONSE or not self.netlink_ok or 0 in self.actual_pressures:
+            return None
+        return self._convert_pressure_to_MM(np.asarray(self.actual_pressures) / 1000.0) + FIXED_LEN
+
     def set_payload(self, payload_kg):
         """
         set passenger weight in killograms
@@ -200,7 +277,7 @@ class OutputInterface(object):
                 pass
                 #  self._slow_move(self.platform_disabled_pos, actuator_lengths, 1000)
             else:
-                self._slow_move(actuator_lengths, self.platform_disabled_pos, 1000)
+                self._slow_move(actuator_lengths, self.platform_disabled_pos, 1000, replace=True)
             
     def move_to_limits(self, pos):
         """
@@ -211,11 +288,11 @@ class OutputInterface(object):
         self.moveTo([p*l for p, l in zip(pos, self.limits)])
 
     def move_to_idle(self, client_pos):
-       self._slow_move(client_pos, self.platform_disabled_pos, 1000)
+       self._slow_move(client_pos, self.platform_disabled_pos, 1000, replace=True)
        #print "move to idle pos"
 
     def move_to_ready(self, client_pos):
-        self._slow_move(self.platform_disabled_pos, client_pos, 1000)
+        self._slow_move(self.platform_disabled_pos, client_pos, 1000, replace=True)
         #print "move to ready pos"
 
     def park_platform(self, state):
@@ -230,20 +307,46 @@ class OutputInterface(object):
         """
         Briefly raises platform high enough to insert access stairs
         
-        moves even if disabled
+        moves even if disabled, returns immediately and the move is played by service
         Args:
-          interval (int): time in ms before dropping back to start pos
+          interval (float): time in seconds before dropping back to start pos
         """       
-        self._slow_move(self.platform_disabled_pos, self.platform_winddown_pos, 1000)
-        time.sleep(interval)
+        self._slow_move(self.platform_disabled_pos, self.platform_winddown_pos, 1000, replace=True)
+        self.trajectory.hold(interval)
         self._slow_move(self.platform_winddown_pos, self.platform_disabled_pos, 1000)
 
-    def move_platform(self, lengths):  # lengths is list of 6 actuator lengths as millimeters
+    def service(self):
+        """
+        plays any active idle, ready or swell move, call from the output loop each frame
+
+        returns numpy array of the actuator lengths sent, None if no move is active
+        """
+        lengths = self.trajectory.tick(self.lengths)
+        if lengths is not None:
+            #  caution, this moves even if disabled
+            self.lengths = lengths
+            if IS_SERIAL:
+                self._move_to_serial(lengths)
+            else:
+                self._move_to(lengths)
+        return lengths
+
+    def is_moving(self):
+        # True while an idle, ready or swell move is playing
+        return self.trajectory.is_active()
+
+    def cancel_move(self):
+        # stops an idle, ready or swell move at its current position
+        self.trajectory.cancel()
+
+    def move_platform(self, lengths, velocities=None):  # lengths is list of 6 actuator lengths as millimeters
         """
         Move all platform actuators to the given lengths
         
         Args:
           lengths (float): numpy array comprising 6 actuator lengths
+          velocities (float): optional numpy array of actuator velocities in mm per sec,
+            if not given the velocity is estimated from the change in length
         """
         clipped = []
         for idx, l in enumerate(lengths):
@@ -253,14 +356,20 @@ class OutputInterface(object):
             elif l > MAX_ACTUATOR_LEN:
                 lengths[idx] = MAX_ACTUATOR_LEN
                 clipped.append(idx)
+        if velocities is not None and len(clipped) > 0:
+            velocities = np.array(velocities, dtype=float)
+            velocities[clipped] = 0  # clipped actuators are not moving
         if len(clipped) > 0:
             pass
             #  print "Warning, actuators", clipped, "were clipped"
+        if self.trajectory.is_active():
+            return  # idle, ready and swell moves have priority
         if self.isEnabled:
+            self.lengths = np.array(lengths, dtype=float)
             if IS_SERIAL:
                 self._move_to_serial(lengths)
             else:
-                self._move_to(lengths)  # only fulfill request if enabled
+                self._move_to(lengths, velocities)  # only fulfill request if enabled
         """
         else:
             print "Platform Disabled"
@@ -271,26 +380,11 @@ class OutputInterface(object):
            self.gui.show_muscles(position_request, muscles, self.pressure_percent)
         
     #  private methods
-    def _slow_move(self, start, end, duration):
-        if IS_SERIAL:
-            move_func = self._move_to_serial
-        else:
-            move_func = self._move_to
-       
-        #  caution, this moves even if disabled
-        interval = 50  # time between steps in ms
-        steps = duration / interval
-        if steps < 1:
-            self.move(end)
-        else:
-            current = start
-            print "moving from", start, "to", end, "steps", steps
-            delta = [float(e - s)/steps for s, e in zip(start, end)]
-            for step in xrange(steps):
-                current = [x + y for x, y in zip(current, delta)]
-                move_func(copy.copy(current))
-                self.show_muscles([0,0,0,0,0,0], current)
-                time.sleep(interval / 1000.0)
+    def _slow_move(self, start, end, duration, replace=False):
+        #  queues a move taking duration ms, played by service so this returns immediately
+        #  if replace is True an active move is cancelled and blended into this one
+        print "moving from", start, "to", end, "in", duration, "ms"
+        self.trajectory.add(end, duration / 1000.0, start, replace)
 
     def _calculate_geometry(self):
         #  reflect around X axis to generate right side coordinates
@@ -356,68 +450,86 @@ class OutputInterface(object):
         else:
             print "serial not open"
 
-    def _move_to(self, lengths):
+    def _move_to(self, lengths, velocities=None):
         now = time.clock()
         timeDelta = now - self.prev_time
         self.prev_time = now
         load_per_muscle = self.loaded_weight / 6  # if needed we could calculate individual muscle loads
-        pressure = []
-        #  print "LENGTHS = ",lengths
-        for idx, len in enumerate(lengths):           
-            pressure.append(int(1000*self._convert_MM_to_pressure(idx, len-FIXED_LEN, timeDelta, load_per_muscle)))
-        self._send(pressure)
-
-    def _convert_MM_to_pressure(self, idx, muscle_len, timeDelta, load):
-        #  returns pressure in bar
+        muscle_lens = np.asarray(lengths, dtype=float) - FIXED_LEN
+        if velocities is not None:
+            velocities = np.asarray(velocities, dtype=float) / 1000  # meters per sec
+        pressure = self._convert_MM_to_pressure(muscle_lens, timeDelta, load_per_muscle, velocities)
+        #  convert bar to millibar flagwords in the reused buffer, the cast truncates like int()
+        np.multiply(pressure, 1000, out=self.pressure_buffer, casting='unsafe')
+        self._send(self.pressure_buffer)
+
+    def _convert_MM_to_pressure(self, muscle_lens, timeDelta, load, velocities=None):
+        #  returns numpy array of pressures in bar for numpy array of muscle lengths
+        #  velocities are muscle velocities in meters per sec, estimated from change in length if None
         #  calculate the percent of muscle contraction to give the desired distance
-        percent = (MAX_MUSCLE_LEN - muscle_len) / float(MAX_MUSCLE_LEN)
+        percent = (MAX_MUSCLE_LEN - muscle_lens) / float(MAX_MUSCLE_LEN)
         #  check for range between 0 and .25
-        #  print "muscle Len =", muscle_len, "percent =", percent
-        if percent < 0 or percent > 0.25:
-            print "%.2f percent contraction out of bounds for muscle length %.1f" % (percent, muscle_len)
-        distDelta = muscle_len-self.prev_pos[idx]  # the change in length from the previous position
-        accel = (distDelta/1000) / timeDelta  # accleration units are meters per sec
-
-        if distDelta < 0:
-            force = load * (1-accel)  # TODO  here we assume force is same magnitude as expanding muscle ???
-            #  TODO modify formula for force
-            #  pressure = 30 * percent*percent + 12 * percent + .01  # assume 25 Newtons for now
-            pressure = 35 * percent*percent + 15 * percent + .03  # assume 25 Newtons for now
-            if PRINT_MUSCLES:
-                print("muscle %d contracting %.1f mm to %.1f, accel is %.2f, force is %.1fN, pressure is %.2f"
-                      % (idx, distDelta, muscle_len, accel, force, pressure))
+        out_of_bounds = (percent < 0) | (percent > 0.25)
+        if out_of_bounds.any():
+            for idx in np.flatnonzero(out_of_bounds):
+                print "%.2f percent contraction out of bounds for muscle length %.1f" % (percent[idx], muscle_lens[idx])
+        if velocities is None:
+            velocities = (muscle_lens - self.prev_pos) / 1000 / max(timeDelta, .001)  # meters per sec
+        if self.pressure_table is not None:
+            pressure = self.pressure_table.pressure(percent, load, velocities)
         else:
-            force = load * (1+accel)  # force in newtons not yet used
-            #  TODO modify formula for expansion
-            pressure = 35 * percent*percent + 15 * percent + .03  # assume 25 Newtons for now
-            if PRINT_MUSCLES:
-                print("muscle %d expanding %.1f mm to %.1f, accel is %.2f, force is %.1fN, pressure is %.2f"
-                      % (idx, distDelta, muscle_len, accel, force, pressure))
-
-        self.prev_pos[idx] = muscle_len  # store the muscle len
+            #  TODO modify formula for force, the same pressure is used for contracting and expanding muscles
+            pressure = 35 * percent * percent + 15 * percent + .03  # assume 25 Newtons for now
+        if PRINT_MUSCLES:
+            force = load * (1 + velocities)  # force in newtons not yet used
+            for idx in xrange(len(muscle_lens)):
+                print("muscle %d moving %.1f mm to %.1f, velocity is %.2f, force is %.1fN, pressure is %.2f"
+                      % (idx, muscle_lens[idx] - self.prev_pos[idx], muscle_lens[idx], velocities[idx],
+                         force[idx], pressure[idx]))
+        if USE_VELOCITY_FEED_FORWARD:
+            pressure -= VELOCITY_FEED_FORWARD_GAIN * velocities  # more pressure to contract, less to expand
+        self.prev_pos[:] = muscle_lens  # store the muscle lengths
         MAX_PRESSURE = 6.0 
         MIN_PRESSURE = .05  # 50 millibar is minimin pressure
-        pressure = max(min(MAX_PRESSURE, pressure), MIN_PRESSURE)  # limit range 
-        return pressure
+        return np.clip(pressure, MIN_PRESSURE, MAX_PRESSURE, out=pressure)  # limit range
+
+    def _convert_pressure_to_MM(self, pressure):
+        #  inverse of the formula in _convert_MM_to_pressure, pressure in bar (numpy array)
+        #  returns the muscle lengths that would give these pressures
+        if self.pressure_table is not None:
+            return MAX_MUSCLE_LEN * (1 - self.pressure_table.contraction(pressure, self.loaded_weight / 6))
+        pressure = np.maximum(pressure, .03)
+        percent = (np.sqrt(15 * 15 + 4 * 35 * (pressure - .03)) - 15) / (2 * 35)
+        return MAX_MUSCLE_LEN * (1 - percent)
 
     def _send(self, muscle_pressures):
+        #  muscle_pressures are millibar, a list or numpy uint16 array
+        #  sends never wait for a response, the most recent readback is used if there is one
         self.requested_pressures = muscle_pressures  # store this for display if reqiured
         if not TESTING:
             try:
                 if not OLD_FESTO_CONTROLLER:
-                    packet = easyip.Factory.send_flagword(0, muscle_pressures)
-                    try:
-                        self._send_packet(packet)
-                        if WAIT_FESTO_RESPONSE:
-                            self.actual_pressures = self._get_pressure()
-                            delta = [act - req for req, act in zip(muscle_pressures, self.actual_pressures)]
-                            self.pressure_percent = [int(d * 100 / req) for d, req in zip(delta, muscle_pressures)]
+                    self._expire_requests()
+                    if WAIT_FESTO_RESPONSE and COMBINED_FESTO_READBACK:
+                        #  write flagwords 0-5 and read back flagwords 10-15, see _request_pressure
+                        encoder = self.send_req_encoder
+                    else:
+                        encoder = self.send_encoder
+                    counter = self._next_counter()
+                    self._send_packet(counter, encoder.encode(counter, muscle_pressures),
+                                      encoder.packet.reqdata_size > 0, muscle_pressures)
+                    if WAIT_FESTO_RESPONSE:
+                        if not COMBINED_FESTO_READBACK:
+                            self._request_pressure()
+                        #  the readback answers an earlier packet, it is compared with the pressures that packet requested
+                        if self._get_pressure(self.actual_pressures, self.compared_pressures) is not None:
+                            requested = self.compared_pressures
+                            np.subtract(self.actual_pressures, requested, out=self.pressure_delta, dtype=np.int32)
+                            np.multiply(self.pressure_delta, 100, out=self.pressure_percent)
+                            np.floor_divide(self.pressure_percent, np.maximum(requested, 1),
+                                            out=self.pressure_percent, casting='unsafe')
                             if PRINT_PRESSURE_DELTA:
-                                print muscle_pressures, delta, self.pressure_percent
-
-                    except socket.timeout:
-                        print "timeout waiting for replay from", self.FST_addr
-
+                                print requested, self.pressure_delta, self.pressure_percent
                 else:
                     for idx, muscle in enumerate(muscle_pressures):
                         maw = int(muscle*1000)
@@ -431,27 +543,80 @@ class OutputInterface(object):
                 s = traceback.format_exc()
                 print "error sending to Festo", e, s
 
-    def _send_packet(self, packet):
+    def _next_counter(self):
+        self.counter = (self.counter + 1) & 0xffff  # counter is a 16 bit field
+        return self.counter
+
+    def _send_packet(self, counter, data, is_readback=False, requested=None):
+        #  sends without waiting, the response is matched to the packet by the receiver thread
+        #  data is the encoded packet with the given counter, is_readback is True if it requests flagwords
+        #  requested is the pressures the readback is compared with, the most recently sent if None
         if not TESTING:
-            data = packet.pack()
             #  print "sending to", self.FST_addr
+            if requested is None:
+                requested = self.requested_pressures
+            with self.pending_lock:
+                self.pending[counter] = (time.time(), is_readback, np.array(requested, dtype='<u2'))
             self.FSTs.sendto(data, self.FST_addr)
-            if WAIT_FESTO_RESPONSE:
-                #  print "in sendpacket,waiting for response..."
-                data, srvaddr = self.FSTs.recvfrom(bufSize)
-                resp = easyip.Packet(data)
-                #  print "in senddpacket, response from Festo", resp
-                if packet.response_errors(resp) is None:
+
+    def _expire_requests(self):
+        #  counts requests with no response as lost, the link is not ok if any are lost
+        oldest = time.time() - FESTO_RESPONSE_TIMEOUT
+        with self.pending_lock:
+            expired = [counter for counter, request in self.pending.iteritems() if request[0] < oldest]
+            for counter in expired:
+                del self.pending[counter]
+        if expired:
+            self.lost_responses += len(expired)
+            if self.netlink_ok:
+                print "timeout waiting for reply from", self.FST_addr
+            self.netlink_ok = False
+
+    def _receiver_thread(self):
+        #  receives Festo responses and matches them to requests by counter
+        while self.is_receiving:
+            try:
+                srvaddr = self.decoder.receive(self.FSTs)
+            except socket.timeout:
+                continue
+            except socket.error:
+                if self.is_receiving:
+                    print "Festo receiver error", sys.exc_info()[1]
+                    time.sleep(FESTO_RESPONSE_TIMEOUT)  # socket errors repeat immediately
+                continue
+            except easyip.PayloadDecodingException as e:
+                print "error receiving from Festo", e
+                continue
+            if srvaddr != self.FST_addr:
+                continue  # not from the Festo, the counter could match by chance
+            try:
+                resp = self.decoder
+                with self.pending_lock:
+                    sent, is_readback, requested = self.pending.pop(resp.counter, (None, None, None))
+                if sent is None:
+                    continue  # response arrived after the request expired
+                round_trip = time.time() - sent
+                if self.round_trip == 0:
+                    self.round_trip = round_trip
+                else:
+                    self.round_trip += 0.1 * (round_trip - self.round_trip)
+                errors = resp.response_errors(resp.counter)  # the counter was matched above
+                if errors is None:
                     self.netlink_ok = True
-                    #  print "No send Errors"
+                    if is_readback and resp.payload_words() >= 6:
+                        with self.readback_lock:
+                            np.copyto(self.readback, self.response_words)
+                            np.copyto(self.readback_requested, requested)
+                            self.readback_sequence += 1
                 else:
                     self.netlink_ok = False
-                    print "errors=%r" % packet.response_errors(resp)
-            else:
-                resp = None
-            return resp
+                    print "errors=%r" % errors
+            except:
+                e = sys.exc_info()[0]
+                s = traceback.format_exc()
+                print "error receiving from Festo", e, s
 
-    def _get_pressure(self):
+    def _request_pressure(self):
         # first arg is the number of requests your making. Leave it as 1 always
         # Second arg is number of words you are requesting (probably 6, or 16)
         # third arg is the offset.
@@ -459,15 +624,24 @@ class OutputInterface(object):
         # words 6-9 are not used
         # words 10-15 are the current values of the presures
         # packet = easyip.Factory.req_flagword(1, 16, 0)
+        #  the counter is used to match the response, see _receiver_thread
+        counter = self._next_counter()
+        self._send_packet(counter, self.req_encoder.encode(counter), True)
+
+    def _get_pressure(self, out, requested=None):
+        #  copies the pressures most recently received into numpy array out and returns it
+        #  and if given, copies the pressures requested by the packet they answer into requested
+        #  returns None if none were received since the previous call
         if TESTING:
-            return self.requested_pressures  # TEMP for testing
-        #  print "attempting to get pressure"
-        try:
-            packet = easyip.Factory.req_flagword(1, 6, 10)
-            resp = self._send_packet(packet)
-            values = resp.decode_payload(easyip.Packet.DIRECTION_REQ)
-            #  print list(values)
-            return list(values)
-        except socket.timeout:
-            print "timeout waiting for Pressures from Festo"
-        return [0,0,0,0,0,0]
+            np.copyto(out, self.requested_pressures)  # TEMP for testing
+            if requested is not None:
+                np.copyto(requested, self.requested_pressures)
+            return out
+        with self.readback_lock:
+            if self.readback_sequence == self.readback_read_sequence:
+                return None
+            self.readback_read_sequence = self.readback_sequence
+            np.copyto(out, self.readback)
+            if requested is not None:
+                np.copyto(requested, self.readback_requested)
+        return out
@@ -0,0 +1,113 @@
+""" predictor
+
+extrapolates pose requests forward in time to compensate for latency
+
+Each axis uses one of the following models:
+  none   : no prediction, the most recent value is returned
+  cv     : constant velocity from the two most recent samples
+  ca     : constant acceleration from the three most recent samples
+  kalman : constant velocity kalman filter, less sensitive to noisy input
+All axes are updated together using numpy arrays.
+Samples closer together than min_interval are treated as min_interval apart
+so velocities from bursts of samples stay bounded, and the extrapolation
+is limited to max_latency seconds and max_offset from the latest value.
+"""
+
+import numpy as np
+
+PREDICTOR_MODELS = ('none', 'cv', 'ca', 'kalman')
+
+
+class PosePredictor(object):
+
+    def __init__(self, models, process_noise=None, measurement_noise=None,
+                 min_interval=0.005, max_latency=0.2, max_offset=None):
+        """
+        models: list with the name of the model used for each axis
+        min_interval: smallest seconds between samples used to calculate velocities
+        max_latency: longest seconds that values are extrapolated
+        max_offset: largest change from the latest value for each axis, None if not limited
+        process_noise: kalman acceleration noise of each axis (units per sec squared)
+        measurement_noise: kalman measurement noise variance of each axis
+        """
+        nbr_axes = len(models)
+        self.models = np.array([PREDICTOR_MODELS.index(m) for m in models])
+        if process_noise is None:
+            process_noise = [1.0] * nbr_axes
+        if measurement_noise is None:
+            measurement_noise = [0.0001] * nbr_axes
+        self.q = np.asarray(process_noise, dtype=float)
+        self.r = np.asarray(measurement_noise, dtype=float)
+        self.min_interval = min_interval
+        self.max_latency = max_latency
+        self.max_offset = None if max_offset is None else np.asarray(max_offset, dtype=float)
+        self.times = np.zeros(3)  # most recent sample is last
+        self.values = np.zeros((3, nbr_axes))
+        self.nbr_samples = 0
+        #  kalman state and covariance for each axis
+        self.position = np.zeros(nbr_axes)
+        self.velocity = np.zeros(nbr_axes)
+        self.p00 = np.ones(nbr_axes)
+        self.p01 = np.zeros(nbr_axes)
+        self.p11 = np.ones(nbr_axes)
+
+    def update(self, timestamp, values):
+        """
+        add a sample, timestamp is in seconds
+        """
+        values = np.asarray(values, dtype=float)
+        if self.nbr_samples > 0 and timestamp <= self.times[-1]:
+            return  # ignore out of order or duplicate samples
+        dt = max(timestamp - self.times[-1], self.min_interval)
+        self.times[:-1] = self.times[1:]
+        self.times[-1] = timestamp
+        self.values[:-1] = self.values[1:]
+        self.values[-1] = values
+        if self.nbr_samples == 0:
+            self.position = values.copy()
+        else:
+            self._kalman_update(dt, values)
+        self.nbr_samples += 1
+
+    def predict(self, latency):
+        """
+        returns numpy array of values extrapolated latency seconds past the most recent sample
+
+        latency can be a single value or a value for each axis
+        """
+        latency = np.clip(latency, 0, self.max_latency)
+        latest = self.values[-1]
+        if self.nbr_samples < 2:
+            return latest.copy()
+        dt1 = max(self.times[-1] - self.times[-2], self.min_interval)
+        velocity = (latest - self.values[-2]) / dt1
+        cv = latest + velocity * latency
+        if self.nbr_samples < 3:
+            ca = cv
+        else:
+            dt0 = max(self.times[-2] - self.times[-3], self.min_interval)
+            accel = (velocity - (self.values[-2] - self.values[-3]) / dt0) / ((dt0 + dt1) / 2)
+            #  velocity was measured half an interval before the latest sample
+            ca = latest + (velocity + accel * dt1 / 2) * latency + accel * latency * latency / 2
+        kalman = self.position + self.velocity * latency
+        prediction = np.choose(self.models, (latest, cv, ca, kalman))
+        if self.max_offset is not None:
+            prediction = np.clip(prediction, latest - self.max_offset, latest + self.max_offset)
+        return prediction
+
+    def _kalman_update(self, dt, z):
+        #  predict
+        self.position += self.velocity * dt
+        self.p00 += 2 * dt * self.p01 + dt * dt * self.p11 + self.q * dt ** 3 / 3
+        self.p01 += dt * self.p11 + self.q * dt * dt / 2
+        self.p11 += self.q * dt
+        #  correct
+        s = self.p00 + self.r
+        k0 = self.p00 / s
+        k1 = self.p01 / s
+        innovation = z - self.position
+        self.position += k0 * innovation
+        self.velocity += k1 * innovation
+        self.p11 -= k1 * self.p01
+        self.p00 *= 1 - k0
+        self.p01 *= 1 - k0
@@ -0,0 +1,145 @@
+""" pressure_table
+
+calibrated muscle pressure model stored as a lookup table
+
+The table holds the pressure in bar needed for each combination of
+muscle contraction (fraction of the relaxed length), load on the muscle (kg)
+and muscle velocity (meters per sec, positive when expanding).
+Pressures between table points are found by trilinear interpolation,
+all muscles are evaluated together with numpy.
+
+Tables are built offline from recorded calibration data and saved to
+an npz file, run this module to build one:
+    python pressure_table.py calibration.csv [pressure_table.npz]
+The csv file has a header line and columns: contraction, load, velocity, pressure.
+Without a csv file a default table is built from the original polynomial
+  pressure = 35 * percent*percent + 15 * percent + .03
+which does not depend on load or velocity.
+"""
+
+import sys
+import numpy as np
+
+#  default table axes
+CONTRACTIONS = np.linspace(-.05, .3, 71)  # covers the .25 working range with a margin either side
+LOADS = np.array([0.0, 50.0, 100.0, 150.0, 200.0])  # kg per muscle
+VELOCITIES = np.array([-1.0, -.5, 0.0, .5, 1.0])  # meters per sec
+
+
+class PressureTable(object):
+
+    def __init__(self, contractions, loads, velocities, pressures):
+        """
+        contractions, loads and velocities are increasing axis values, at least two of each
+        pressures is array of bar with shape (len(contractions), len(loads), len(velocities))
+        """
+        self.axes = [np.asarray(a, dtype=float) for a in (contractions, loads, velocities)]
+        self.pressures = np.asarray(pressures, dtype=float)
+        shape = tuple(len(a) for a in self.axes)
+        if self.pressures.shape != shape or min(shape) < 2:
+            raise ValueError("pressure table shape %s does not match axes %s" % (self.pressures.shape, shape))
+        self._strides = np.array([shape[1] * shape[2], shape[2], 1])
+        #  offsets of the 8 corners of a table cell, used for interpolation
+        self._corners = (np.arange(8)[:, np.newaxis] >> np.arange(2, -1, -1)) & 1
+        self._corner_offsets = np.dot(self._corners, self._strides)
+
+    @classmethod
+    def from_polynomial(cls):
+        # table matching the original pressure formula, the same for all loads and velocities
+        p = CONTRACTIONS
+        column = 35 * p * p + 15 * p + .03
+        pressures = np.empty((len(CONTRACTIONS), len(LOADS), len(VELOCITIES)))
+        pressures[:] = column[:, np.newaxis, np.newaxis]
+        return cls(CONTRACTIONS, LOADS, VELOCITIES, pressures)
+
+    @classmethod
+    def load(cls, fname):
+        data = np.load(fname)
+        return cls(data['contractions'], data['loads'], data['velocities'], data['pressures'])
+
+    def save(self, fname):
+        np.savez(fname, contractions=self.axes[0], loads=self.axes[1], velocities=self.axes[2],
+                 pressures=self.pressures)
+
+    def pressure(self, contractions, loads, velocities):
+        """
+        returns numpy array of pressures in bar
+
+        arguments are arrays (or single values) for each muscle, values outside the table are clamped
+        """
+        index, weights = self._weights(contractions, loads, velocities)
+        return np.sum(self.pressures.take(index) * weights, 1)
+
+    def contraction(self, pressures, load):
+        """
+        returns numpy array of contractions giving the pressures for a still muscle, inverse of pressure
+        """
+        column = self.pressure(self.axes[0], load, 0.0)
+        column = np.maximum.accumulate(column)  # np.interp needs increasing values
+        return np.interp(pressures, column, self.axes[0])
+
+    def _weights(self, contractions, loads, velocities):
+        #  returns N x 8 arrays of flat table indices and interpolation weights
+        values = np.broadcast_arrays(np.atleast_1d(contractions), np.atleast_1d(loads), np.atleast_1d(velocities))
+        cells = np.empty((len(values[0]), 3), dtype=int)
+        fractions = np.empty((len(values[0]), 3))
+        for i, axis in enumerate(self.axes):
+            u = np.interp(values[i], axis, np.arange(len(axis)))  # fractional index, clamped to the table
+            cells[:, i] = np.minimum(u.astype(int), len(axis) - 2)
+            fractions[:, i] = u - cells[:, i]
+        f = fractions[:, np.newaxis, :]
+        weights = np.prod(np.where(self._corners, f, 1 - f), 2)
+        index = np.dot(cells, self._strides)[:, np.newaxis] + self._corner_offsets
+        return index, weights
+
+
+def fit(contractions, loads, velocities, pressures, smoothing=0.01, axes=None, chunk_size=10000):
+    """
+    returns PressureTable fitted to calibration samples by least squares
+
+    smoothing penalizes curvature along each axis, this also fills table
+    points with no nearby samples
+    axes is optional list of contraction, load and velocity axis values
+    The normal equations are accumulated chunk_size samples at a time so
+    memory use depends on the table size, not the number of samples.
+    """
+    if axes is None:
+        axes = [CONTRACTIONS, LOADS, VELOCITIES]
+    table = PressureTable(axes[0], axes[1], axes[2], np.zeros([len(a) for a in axes]))
+    size = table.pressures.size
+    AtA = np.zeros((size, size))
+    Atb = np.zeros(size)
+    contractions, loads, velocities, pressures = np.broadcast_arrays(
+        np.atleast_1d(contractions), np.atleast_1d(loads), np.atleast_1d(velocities), np.atleast_1d(pressures))
+    for start in xrange(0, len(pressures), chunk_size):
+        end = start + chunk_size
+        index, weights = table._weights(contractions[start:end], loads[start:end], velocities[start:end])
+        #  each sample adds the outer product of its 8 corner weights
+        np.add.at(AtA, (index[:, :, np.newaxis], index[:, np.newaxis, :]),
+                  weights[:, :, np.newaxis] * weights[:, np.newaxis, :])
+        np.add.at(Atb, index, weights * pressures[start:end, np.newaxis])
+    #  second differences along each axis, each row has coefficients 1, -2, 1
+    flat = np.arange(size).reshape(table.pressures.shape)
+    coefficients = smoothing * np.array([1.0, -2.0, 1.0])
+    for axis in range(3):
+        n = table.pressures.shape[axis]
+        index = np.column_stack([np.take(flat, range(i, n - 2 + i), axis).ravel() for i in range(3)])
+        np.add.at(AtA, (index[:, :, np.newaxis], index[:, np.newaxis, :]),
+                  np.outer(coefficients, coefficients))
+    solution = np.linalg.lstsq(AtA, Atb, rcond=None)[0]
+    table.pressures = solution.reshape(table.pressures.shape)
+    return table
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        samples = np.loadtxt(sys.argv[1], delimiter=',', skiprows=1, ndmin=2)
+        table = fit(samples[:, 0], samples[:, 1], samples[:, 2], samples[:, 3])
+        residuals = table.pressure(samples[:, 0], samples[:, 1], samples[:, 2]) - samples[:, 3]
+        print "fitted", len(samples), "samples, rms error %.3f bar" % np.sqrt(np.mean(residuals * residuals))
+    else:
+        table = PressureTable.from_polynomial()
+        print "no calibration file given, using the default polynomial table"
+    fname = sys.argv[2] if len(sys.argv) > 2 else "pressure_table.npz"
+    table.save(fname)
+    print "saved pressure table to", fname
@@ -0,0 +1,174 @@
+""" resampler
+
+interpolates timestamped pose samples at the time of each control tick
+
+Samples arrive at the client's rate, sample returns the pose at any
+requested time so the control loop gets a smooth fixed rate stream.
+Poses are interpolated a short delay in the past (by default the average
+interval between received samples or batches) so there are samples on both sides.
+average returns the mean pose over the interval between two ticks, so every
+sample received faster than the tick rate contributes instead of being skipped.
+
+Translations are interpolated linearly or with a cubic hermite spline.
+If slerp is True rotations are treated as roll, pitch and yaw in radians and
+interpolated along the shortest rotation between the two samples,
+otherwise they are interpolated the same way as translations.
+"""
+
+import numpy as np
+
+RESAMPLER_INTERPOLATIONS = ('linear', 'cubic')
+
+
+class PoseResampler(object):
+
+    def __init__(self, capacity=64, interpolation='linear', slerp=False, delay=None):
+        """
+        capacity: number of samples kept
+        delay: seconds to sample in the past, if None the average sample interval is used
+        """
+        self.interpolation = interpolation
+        self.slerp = slerp
+        self.delay = delay
+        self.times = np.zeros(capacity)  # oldest first
+        self.poses = np.zeros((capacity, 6))
+        self.count = 0
+        self.interval = 0.0  # average time between calls to add or add_batch
+
+    def add(self, timestamp, pose):
+        self.add_batch([timestamp], [pose])
+
+    def add_batch(self, timestamps, poses):
+        """
+        adds samples in time order, timestamps is list or array of N times and poses is N x 6
+        """
+        timestamps = np.asarray(timestamps, dtype=float)
+        poses = np.asarray(poses, dtype=float).reshape(-1, 6)
+        if self.count > 0:
+            newer = timestamps > self.times[-1]  # ignore out of order or duplicate samples
+            timestamps = timestamps[newer]
+            poses = poses[newer]
+        n = min(len(timestamps), len(self.times))
+        if n == 0:
+            return
+        if self.count > 0:
+            #  interval is time between batches, the delay must cover this to have samples on both sides
+            interval = timestamps[-1] - self.times[-1]
+            if self.interval == 0:
+                self.interval = interval
+            else:
+                self.interval += 0.1 * (interval - self.interval)
+        self.times[:-n] = self.times[n:]
+        self.poses[:-n] = self.poses[n:]
+        self.times[-n:] = timestamps[-n:]
+        self.poses[-n:] = poses[-n:]
+        self.count = min(self.count + n, len(self.times))
+
+    def latest_time(self):
+        # returns time of most recent sample, None if no samples
+        if self.count == 0:
+            return None
+        return self.times[-1]
+
+    def sample(self, timestamp):
+        """
+        returns numpy array of the pose at timestamp less delay, None if no samples
+        """
+        if self.count == 0:
+            return None
+        if self.delay is None:
+            t = timestamp - self.interval
+        else:
+            t = timestamp - self.delay
+        times = self.times[-self.count:]
+        poses = self.poses[-self.count:]
+        if t >= times[-1]:
+            return poses[-1].copy()  # hold most recent pose, no extrapolation
+        if t <= times[0]:
+            return poses[0].copy()
+        i = np.searchsorted(times, t)  # times[i-1] < t <= times[i]
+        f = (t - times[i - 1]) / (times[i] - times[i - 1])
+        if self.interpolation == 'cubic':
+            pose = self._hermite(times, poses, i, f)
+        else:
+            pose = poses[i - 1] + f * (poses[i] - poses[i - 1])
+        if self.slerp:
+            q = _slerp(_rpy_to_quaternion(poses[i - 1, 3:]), _rpy_to_quaternion(poses[i, 3:]), f)
+            pose[3:] = _quaternion_to_rpy(q)
+        return pose
+
+    def average(self, start, end):
+        """
+        returns numpy array of the mean pose between start and end less delay, None if no samples
+
+        the mean is of the linearly interpolated poses, so it includes every sample in the interval
+        capacity must hold the samples received over the delay plus the interval
+        """
+        if self.count < 2 or end <= start:
+            return self.sample(end)
+        delay = self.interval if self.delay is None else self.delay
+        t0 = start - delay
+        t1 = end - delay
+        times = self.times[-self.count:]
+        poses = self.poses[-self.count:]
+        inside = (times > t0) & (times < t1)
+        t = np.concatenate(([t0], times[inside], [t1]))
+        p = np.vstack((self._linear(times, poses, t0), poses[inside], self._linear(times, poses, t1)))
+        if self.slerp:
+            p[:, 3:] = np.unwrap(p[:, 3:], axis=0)  # angles are averaged without jumps at +-pi
+        #  area under each linear segment
+        pose = np.dot(np.diff(t), p[1:] + p[:-1]) / (2 * (t1 - t0))
+        if self.slerp:
+            pose[3:] = (pose[3:] + np.pi) % (2 * np.pi) - np.pi
+        return pose
+
+    def _linear(self, times, poses, t):
+        #  pose at time t interpolated linearly, held at the first and last samples
+        i = min(max(np.searchsorted(times, t), 1), len(times) - 1)
+        f = min(max((t - times[i - 1]) / (times[i] - times[i - 1]), 0.0), 1.0)
+        return poses[i - 1] + f * (poses[i] - poses[i - 1])
+
+    def _hermite(self, times, poses, i, f):
+        #  cubic hermite spline between samples i-1 and i, tangents from neighbouring samples
+        h = times[i] - times[i - 1]
+        m0 = self._tangent(times, poses, i - 1) * h
+        m1 = self._tangent(times, poses, i) * h
+        f2 = f * f
+        f3 = f2 * f
+        return ((2 * f3 - 3 * f2 + 1) * poses[i - 1] + (f3 - 2 * f2 + f) * m0 +
+                (-2 * f3 + 3 * f2) * poses[i] + (f3 - f2) * m1)
+
+    def _tangent(self, times, poses, k):
+        lo = max(k - 1, 0)
+        hi = min(k + 1, len(times) - 1)
+        return (poses[hi] - poses[lo]) / (times[hi] - times[lo])
+
+
+def _rpy_to_quaternion(rpy):
+    #  quaternion [w, x, y, z] of 3-2-1 (yaw, pitch, roll) rotation
+    cr, cp, cy = np.cos(np.asarray(rpy) / 2)
+    sr, sp, sy = np.sin(np.asarray(rpy) / 2)
+    return np.array([cr * cp * cy + sr * sp * sy,
+                     sr * cp * cy - cr * sp * sy,
+                     cr * sp * cy + sr * cp * sy,
+                     cr * cp * sy - sr * sp * cy])
+
+
+def _quaternion_to_rpy(q):
+    w, x, y, z = q
+    roll = np.arctan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y))
+    pitch = np.arcsin(np.clip(2 * (w * y - z * x), -1, 1))
+    yaw = np.arctan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+    return np.array([roll, pitch, yaw])
+
+
+def _slerp(q0, q1, f):
+    d = np.dot(q0, q1)
+    if d < 0:  # take the shortest path
+        q1 = -q1
+        d = -d
+    if d > 0.9995:
+        q = q0 + f * (q1 - q0)  # nearly the same rotation, linear is accurate
+        return q / np.linalg.norm(q)
+    theta = np.arccos(d)
+    return (np.sin((1 - f) * theta) * q0 + np.sin(f * theta) * q1) / np.sin(theta)
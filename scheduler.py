@@ -0,0 +1,78 @@
+""" scheduler
+
+fixed rate tick scheduler for the control loop
+
+Ticks are scheduled at absolute deadlines so timing errors do not accumulate.
+wait sleeps until shortly before the deadline and then spins for the
+remaining time, giving sub millisecond precision without using a whole core.
+wait can also be woken early by a threading.Event set when new input arrives.
+On windows sleep is only accurate to the 15.6 ms timer interrupt, so the
+timer resolution is raised to 1 ms while the program runs. If that fails
+the default spin time covers the whole timer interval.
+"""
+
+import sys
+import time
+
+if hasattr(time, 'monotonic'):
+    monotonic = time.monotonic
+elif sys.platform == 'win32':
+    monotonic = time.clock  # on windows this is a high resolution clock counting from the first call
+else:
+    monotonic = time.time
+
+SLEEP_RESOLUTION = 0.002  # seconds sleep may overrun, the default spin time
+if sys.platform == 'win32':
+    try:
+        import atexit
+        import ctypes
+        winmm = ctypes.windll.winmm
+        if winmm.timeBeginPeriod(1) == 0:  # TIMERR_NOERROR
+            atexit.register(winmm.timeEndPeriod, 1)
+        else:
+            SLEEP_RESOLUTION = 0.016
+    except (ImportError, AttributeError, OSError):
+        SLEEP_RESOLUTION = 0.016
+
+
+class TickScheduler(object):
+
+    def __init__(self, period, spin_time=None):
+        """
+        period: seconds between ticks
+        spin_time: seconds before each deadline to stop sleeping and spin, SLEEP_RESOLUTION if None
+        """
+        self.period = period
+        self.spin_time = SLEEP_RESOLUTION if spin_time is None else spin_time
+        self.deadline = None
+        self.overruns = 0  # number of ticks that started more than a period late
+
+    def set_period(self, period):
+        self.period = period
+        self.deadline = None  # restart timing from the next call to wait
+
+    def wait(self, wake_event=None):
+        """
+        returns True when the next tick is due, or False if wake_event was set first
+
+        if woken early the tick deadline is unchanged, call wait again to wait for it
+        """
+        now = monotonic()
+        if self.deadline is None:
+            self.deadline = now + self.period
+        remaining = self.deadline - now
+        while remaining > 0:
+            if remaining > self.spin_time:
+                if wake_event is not None:
+                    if wake_event.wait(remaining - self.spin_time):
+                        wake_event.clear()
+                        return False
+                else:
+                    time.sleep(remaining - self.spin_time)
+            remaining = self.deadline - monotonic()
+        self.deadline += self.period
+        if self.deadline < now:
+            #  more than a period late, skip missed ticks rather than running them back to back
+            self.overruns += 1
+            self.deadline = now + self.period
+        return True
@@ -4,31 +4,40 @@
   and returns actual lengths (using range passed in begin method)
 
   Smooth method takes either norm or real values and returns moving average
+
+  Both methods take an optional dt, the time in seconds since the previous call,
+  washout and smoothing time constants are in seconds so they do not depend on frame rate
 """
 
 import traceback
 import numpy as np
 import Tkinter as tk
-from moving_average import MovingAverage
+from filters import FilterBank, FILTER_TYPES
+from washout import ClassicalWashout
 
 
 class Shape(object):
 
     def __init__(self, frame_rate):
         #  init code goes here
-        self.frame_rate = frame_rate
+        self.frame_rate = frame_rate  # nominal time between updates, used when dt is not given
 
         # These default values are overwritten with values in config file
-        self.moving_average = []
         self.gains = np.array([1.0, 1.0, 1.0, 1.0, 1.0, 1.0])  # xyzrpy gains
         self.master_gain = 1.0
         #  washout_time is number of seconds to decay below 2%
         self.washout_time = [12, 12, 12, 12, 0, 12]        
-        self.washout_factor = np.array([0.0, 0.0, 0.0, 0.0, 0.0, 0.0])
         #self.washout_enable = np.array([0, 0, 0, 0, 0, 0])
-        for idx, t in enumerate(self.washout_time):
-            self.set_washout(idx, self.washout_time[idx])
         self.ma_samples  = [1, 1, 1, 1, 1, 1]
+        self.ma_times = [0, 0, 0, 0, 0, 0]  # moving average window in seconds
+        self.filter_types = ['ma', 'ma', 'ma', 'ma', 'ma', 'ma']  # smoothing filter for each axis
+        self.cutoffs = [2.0, 2.0, 2.0, 2.0, 2.0, 2.0]  # filter cutoff frequency in Hz
+        self.euro_betas = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]  # speed coefficient of one euro filters
+        self.create_filters()
+        self.washout_mode = 'decay'  # 'decay' uses washout_time, 'classical' uses ClassicalWashout
+        self.washout_cutoffs = [0.5, 0.5, 0.5, 0.3, 0.3, 0.3]  # classical washout high pass cutoffs in Hz
+        self.tilt_coordination = [0.5, 0.5, 0.3]  # classical washout tilt gain, cutoff in Hz and rate limit
+        self.create_washout()
         self.prev_washed = np.array([0.0, 0.0, 0.0, 0.0, 0.0, 0.0])  # previous washout values
         self.prev_value = np.array([0.0, 0.0, 0.0, 0.0, 0.0, 0.0])  # previous request
         self.intensity = 1.0 #  factor to adjust final gain from remote control
@@ -119,8 +128,41 @@ class Shape(object):
                 #  print washout_time
             elif option == 'moving_averages':
                 self.ma_samples = [int(i) for i in options['moving_averages']]
-                for count in self.ma_samples:
-                    self.moving_average.append(MovingAverage(count))
+                self.ma_times = [n * self.frame_rate for n in self.ma_samples]
+            elif option == 'moving_average_times':
+                self.ma_times = [float(i) for i in options['moving_average_times']]
+                self.ma_samples = [int(round(t / self.frame_rate)) for t in self.ma_times]
+            elif option == 'washout_mode':
+                self.washout_mode = options['washout_mode'][0].strip()
+            elif option == 'washout_cutoffs':
+                self.washout_cutoffs = [float(i) for i in options['washout_cutoffs']]
+            elif option == 'tilt_coordination':
+                self.tilt_coordination = [float(i) for i in options['tilt_coordination']]
+            elif option == 'filters':
+                self.filter_types = [t.strip() for t in options['filters']]
+                for idx, t in enumerate(self.filter_types):
+                    if t not in FILTER_TYPES:
+                        print "unknown filter type", t, "in shape config, using moving average"
+                        self.filter_types[idx] = 'ma'
+            elif option == 'cutoffs':
+                self.cutoffs = [float(i) for i in options['cutoffs']]
+            elif option == 'euro_betas':
+                self.euro_betas = [float(i) for i in options['euro_betas']]
+        self.create_filters()
+        self.create_washout()
+        print "washout mode is", self.washout_mode
+        print "smoothing delay in ms:", ', '.join('%.0f' % (d * 1000) for d in self.get_smoothing_delay())
+
+    def create_filters(self):
+        self.filters = FilterBank(self.filter_types, self.ma_times, self.cutoffs, self.euro_betas, self.frame_rate)
+
+    def create_washout(self):
+        gain, cutoff, rate = self.tilt_coordination
+        self.classical_washout = ClassicalWashout(self.washout_cutoffs, gain, cutoff, rate, self.frame_rate)
+
+    def get_smoothing_delay(self):
+        #  returns list of delay in seconds added by the smoothing filter of each axis
+        return list(self.filters.group_delay())
 
     def fin(self):
         #  exit code goes here
@@ -149,19 +191,17 @@ class Shape(object):
 
     def set_washout(self, idx, value):
         #  expects washout duration (time to decay below 2%)
-        #  zero disables washout
+        #  zero disables washout, the decay factor is calculated from dt in shape
         self.washout_time[idx] = value
-        if value == 0:
-            self.washout_factor[idx] = 0
-        else:
-            self.washout_factor[idx] = 1.0 - self.frame_rate / value * 4
-            #  print "in shape", idx, " washout time set to ", value, "decay factor=", self.washout_factor[idx]
 
     def get_washouts(self):
         #  print "in shape", self.washout_time
         return self.washout_time
 
-    def shape(self, request):
+    def shape(self, request, dt=None):
+        #  dt is seconds since previous request, frame_rate is used if None
+        if dt is None:
+            dt = self.frame_rate
         #  use gain setting to increase or decrease values
         # print request
         # print "in shape", request, self.gains, self.master_gain
@@ -169,22 +209,29 @@ class Shape(object):
 
         np.clip(r, -1, 1, r)  # clip normalized values
         #  print "clipped", r
-        for idx, f in enumerate(self.washout_factor):
+        if self.washout_mode == 'classical':
+            r = self.classical_washout.next(r, dt)
+            np.clip(r, -1, 1, r)
+        else:
             #  if washout enabled and request is less than prev washed value, decay more
-            if f != 0 and abs(request[idx]) < abs(self.prev_value[idx]):
-                #  here if washout is enabled
-                r[idx] =  self.prev_value[idx] * self.washout_factor[idx]
+            #  washout_time is time to decay below 2%, exp(-4) is .018
+            washout_time = np.array(self.washout_time, dtype=float)
+            enabled = washout_time > 0
+            factor = np.exp(-4.0 * dt / np.where(enabled, washout_time, 1))
+            decay = enabled & (np.abs(request) < np.abs(self.prev_value))
+            r = np.where(decay, self.prev_value * factor, r)
         self.prev_value = r       
         #  convert from normalized to real world values
         r = np.multiply(r, self.range)  
         #print "real",r, self.range
         return r
 
-    def smooth(self, request):
-        for idx, count in enumerate(self.ma_samples):
-            if count > 1:
-                request[idx] = self.moving_average[idx].next(request[idx])
-        return request
+    def smooth(self, request, dt=None):
+        return self.filters.next(request, dt)
+
+    def smooth_frames(self, requests):
+        #  smooths N x 6 array of requests, for offline use
+        return self.filters.filter_frames(requests)
 
     def update_washouts(self):
         for i in range(6):
@@ -241,3 +288,17 @@ class Shape(object):
                         outfile.write("washouts=" + ', '.join(str(w) for w in self.get_washouts()) + "\n")
                     elif option == 'moving_averages':
                         outfile.write("moving_averages=" + ', '.join(str(w) for w in self.ma_samples) + "\n")
+                    elif option == 'moving_average_times':
+                        outfile.write("moving_average_times=" + ', '.join(str(t) for t in self.ma_times) + "\n")
+                    elif option == 'washout_mode':
+                        outfile.write("washout_mode=" + self.washout_mode + "\n")
+                    elif option == 'washout_cutoffs':
+                        outfile.write("washout_cutoffs=" + ', '.join(str(c) for c in self.washout_cutoffs) + "\n")
+                    elif option == 'tilt_coordination':
+                        outfile.write("tilt_coordination=" + ', '.join(str(t) for t in self.tilt_coordination) + "\n")
+                    elif option == 'filters':
+                        outfile.write("filters=" + ', '.join(self.filter_types) + "\n")
+                    elif option == 'cutoffs':
+                        outfile.write("cutoffs=" + ', '.join(str(c) for c in self.cutoffs) + "\n")
+                    elif option == 'euro_betas':
+                        outfile.write("euro_betas=" + ', '.join(str(b) for b in self.euro_betas) + "\n")
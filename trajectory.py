@@ -0,0 +1,202 @@
+""" trajectory
+
+non-blocking transitions between actuator positions (idle, ready, park and swell moves)
+
+Moves are queued as segments and played back by calling tick from the
+output loop each frame, so commands return immediately and the output
+loop keeps running while a transition plays out.
+Each segment starts from wherever the platform is when it begins, so
+a move queued with replace=True blends from the current position of an
+interrupted move instead of jumping to the start of the new move.
+A start position can be given for a move queued while no move is active,
+otherwise the lengths most recently sent to the platform are used.
+
+The actuator lengths of a whole segment are calculated when it begins,
+following one of these velocity profiles:
+  linear      : constant velocity, abrupt start and stop
+  min_jerk    : minimum jerk polynomial, smooth start and stop
+  trapezoidal : constant acceleration to a constant velocity and back
+  s_curve     : trapezoidal with smoothed (sine shaped) acceleration ramps
+Moves are interpolated in pose space through inverse kinematics if a
+Kinematics object is given, otherwise in actuator space. Calculated
+segments are cached so repeated moves between the same positions are reused.
+"""
+
+from collections import deque
+import math
+import numpy as np
+from scheduler import monotonic
+
+TRAJECTORY_PROFILES = ('linear', 'min_jerk', 'trapezoidal', 's_curve')
+
+
+def profile(name, fractions, ramp_time=0.25):
+    """
+    returns numpy array of the fraction of the distance moved at each fraction of the duration
+
+    ramp_time is the fraction of the duration spent accelerating (and decelerating)
+    for the trapezoidal and s_curve profiles
+    """
+    t = np.clip(np.asarray(fractions, dtype=float), 0, 1)
+    if name == 'linear':
+        return t
+    if name == 'min_jerk':
+        return t * t * t * (10 - 15 * t + 6 * t * t)
+    if name == 'trapezoidal':
+        ramp = lambda u: u * u / (2 * ramp_time)  # distance moved while accelerating for time u
+    elif name == 's_curve':
+        ramp = lambda u: u / 2 - ramp_time / (2 * math.pi) * np.sin(math.pi * u / ramp_time)
+    else:
+        raise ValueError("unknown trajectory profile " + str(name))
+    #  distance is normalized by the area under the velocity curve, 1 - ramp_time
+    total = 1 - ramp_time
+    distance = np.where(t < ramp_time, ramp(np.minimum(t, ramp_time)), ramp_time / 2 + t - ramp_time)
+    distance = np.where(t > 1 - ramp_time, total - ramp(np.minimum(1 - t, ramp_time)), distance)
+    return distance / total
+
+
+class TrajectorySegment(object):
+
+    def __init__(self, end, duration, start=None):
+        """
+        end: actuator lengths at the end of the segment, None to hold the current position
+        duration: seconds taken to reach end
+        start: actuator lengths at the start, None to start from the current position
+        """
+        self.end = None if end is None else np.array(end, dtype=float)
+        self.duration = float(duration)
+        self.start = None if start is None else np.array(start, dtype=float)
+        self.start_time = None  # set when the segment begins
+        self.lengths = None  # N x 6 array of lengths at each sample period
+
+    def begin(self, current, start_time, lengths):
+        """
+        current: lengths used if the segment was queued without a start
+        lengths: function returning the lengths array of the segment given start, end and duration
+        """
+        if self.start is None:
+            self.start = np.array(current, dtype=float)
+        if self.end is None:
+            self.end = self.start.copy()
+        self.start_time = start_time
+        self.lengths = lengths(self.start, self.end, self.duration)
+
+    def position(self, now):
+        """
+        returns (lengths, True if the segment is finished) at time now
+        """
+        elapsed = now - self.start_time
+        if elapsed >= self.duration:
+            return self.end.copy(), True
+        #  interpolate between samples so timing jitter in the output loop does not matter
+        u = elapsed / self.duration * (len(self.lengths) - 1)
+        i = int(u)
+        f = u - i
+        return self.lengths[i] + f * (self.lengths[i + 1] - self.lengths[i]), False
+
+
+class TrajectoryEngine(object):
+
+    def __init__(self, sample_period=0.05, profile='min_jerk', kinematics=None, cache_size=16):
+        """
+        sample_period: seconds between precalculated positions, usually the output frame period
+        profile: name of the velocity profile, see TRAJECTORY_PROFILES
+        kinematics: Kinematics object used to interpolate in pose space, None for actuator space
+        """
+        if profile not in TRAJECTORY_PROFILES:
+            raise ValueError("unknown trajectory profile " + str(profile))
+        self.sample_period = sample_period
+        self.profile = profile
+        self.kinematics = kinematics
+        self.cache_size = cache_size
+        self.cache = {}  # lengths arrays keyed by (start, end, duration)
+        self.segments = deque()  # queued segments, the active segment is first
+        self.position = None  # most recent lengths returned by tick
+
+    def set_kinematics(self, kinematics):
+        # moves are interpolated in pose space if kinematics is not None
+        self.kinematics = kinematics
+        self.cache.clear()
+
+    def add(self, end, duration, start=None, replace=False):
+        """
+        queue a move to end actuator lengths taking duration seconds
+
+        start is ignored if a move is already active or queued, the move
+        then starts where the previous one ends.
+        if replace is True any queued moves are cancelled and this move
+        starts from the current position
+        """
+        if replace and self.segments:
+            if self.segments[0].start_time is None:
+                start = self.segments[0].start  # not begun yet, None starts from the current lengths
+            else:
+                start = self.position
+            self.segments.clear()
+        elif self.segments:
+            start = None
+        self.segments.append(TrajectorySegment(end, duration, start))
+
+    def hold(self, duration):
+        # queue a pause at the position reached by the previous segment
+        self.add(None, duration)
+
+    def cancel(self):
+        # stop at the current position
+        self.segments.clear()
+        self.position = None
+
+    def is_active(self):
+        return len(self.segments) > 0
+
+    def tick(self, current, now=None):
+        """
+        returns numpy array of actuator lengths for this frame, None if no move is active
+
+        current is the lengths most recently sent to the platform
+        """
+        if not self.segments:
+            return None
+        if now is None:
+            now = monotonic()
+        segment = self.segments[0]
+        if segment.start_time is None:
+            segment.begin(current, now, self.segment_lengths)
+        self.position, is_finished = segment.position(now)
+        if is_finished:
+            self.segments.popleft()
+            position = self.position
+            if self.segments:
+                self.segments[0].begin(self.position, now, self.segment_lengths)
+            else:
+                self.position = None  # stale once other moves are streamed
+            return position.copy()
+        return self.position.copy()
+
+    def segment_lengths(self, start, end, duration):
+        """
+        returns N x 6 numpy array of lengths at each sample period of a move from start to end
+
+        start and end are actuator lengths, results are cached
+        """
+        key = (tuple(np.round(start, 1)), tuple(np.round(end, 1)), round(duration, 3))
+        lengths = self.cache.get(key)
+        if lengths is None:
+            lengths = self._calculate_lengths(start, end, duration)
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            self.cache[key] = lengths
+        return lengths
+
+    def _calculate_lengths(self, start, end, duration):
+        steps = max(int(math.ceil(duration / self.sample_period)), 1)
+        distance = profile(self.profile, np.linspace(0, 1, steps + 1))[:, np.newaxis]
+        if self.kinematics is not None:
+            start_pose = self.kinematics.forward_kinematics(start, np.zeros(6))
+            end_pose = self.kinematics.forward_kinematics(end, np.zeros(6))
+            if start_pose is not None and end_pose is not None:
+                lengths = self.kinematics.inverse_kinematics_batch(start_pose + distance * (end_pose - start_pose))
+                lengths[0] = start  # exact end points even if the kinematics tolerance is coarse
+                lengths[-1] = end
+                return lengths
+        return start + distance * (end - start)  # actuator space
@@ -0,0 +1,51 @@
+""" washout
+
+classical motion cueing washout for the shape module
+
+Translations and rotations are high pass filtered so sustained requests
+return the platform to the center. Sustained surge and sway are instead
+low pass filtered and cued by tilting the platform so gravity gives the
+feeling of sustained acceleration, the tilt rate is limited to stay below
+the rate the rider can perceive.
+
+All values are normalized (-1 to +1) and all axes are updated together.
+"""
+
+import numpy as np
+from filters import ButterworthFilter
+
+SURGE, SWAY, ROLL, PITCH = 0, 1, 3, 4
+
+
+class ClassicalWashout(object):
+
+    def __init__(self, cutoffs, tilt_gain, tilt_cutoff, tilt_rate, sample_period):
+        """
+        cutoffs: high pass cutoff frequency in Hz of each axis
+        tilt_gain: normalized tilt per normalized surge or sway, zero disables tilt coordination
+        tilt_cutoff: low pass cutoff frequency in Hz of surge and sway used for tilt
+        tilt_rate: max change in tilt in normalized units per second
+        """
+        self.sample_period = sample_period
+        self.high_pass = ButterworthFilter(cutoffs, sample_period, high_pass=True)
+        self.low_pass = ButterworthFilter([tilt_cutoff, tilt_cutoff], sample_period)
+        self.tilt_gain = tilt_gain
+        self.tilt_rate = tilt_rate
+        self.tilt = np.zeros(2)  # roll and pitch tilt
+
+    def next(self, request, dt=None):
+        """
+        dt is the time in seconds since the previous update, sample_period is used if None
+        """
+        dt = dt or self.sample_period
+        r = self.high_pass.next(request, dt)
+        if self.tilt_gain != 0:
+            sustained = self.low_pass.next(request[SURGE:SWAY + 1], dt)
+            #  forward acceleration is cued with nose up (negative pitch),
+            #  acceleration to the left with right side down (positive roll)
+            target = self.tilt_gain * np.array([sustained[1], -sustained[0]])
+            max_step = self.tilt_rate * dt
+            self.tilt += np.clip(target - self.tilt, -max_step, max_step)
+            r[ROLL] += self.tilt[0]
+            r[PITCH] += self.tilt[1]
+        return r
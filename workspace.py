@@ -0,0 +1,222 @@
+""" workspace
+
+precomputed reachability grid over the 6 DOF workspace of the platform
+
+Each grid point holds the margin of a pose: the distance in mm between
+the actuator nearest to its limit and that limit, negative if the pose is
+not reachable. Margins between grid points are interpolated so the cost of
+a check does not depend on the grid size. Interpolated margins are estimates,
+they underestimate the margin inside the workspace and overestimate it by
+less than a mm, use exact_margins where the precise value near the boundary matters.
+The grid is built with vectorized inverse kinematics and cached to disk,
+it is rebuilt if the geometry or actuator lengths change.
+
+The single DOF and combined limit tables in the platform config file
+can also be calculated here instead of being entered by hand.
+"""
+
+import numpy as np
+
+#  search bounds used when finding the extent of movement along each axis
+MAX_TRANSLATION = 500.0  # mm
+MAX_ROTATION = np.pi / 2  # radians
+
+
+class Workspace(object):
+
+    def __init__(self, kinematics, min_actuator_len, max_actuator_len):
+        self.k = kinematics
+        self.min_actuator_len = min_actuator_len
+        self.max_actuator_len = max_actuator_len
+        self.grid = None
+
+    def begin(self, cache_fname=None, steps=11):
+        """
+        load the reachability grid from cache_fname, building it if needed
+
+        steps is the number of grid points along each of the 6 axes
+        if cache_fname is None no grid is used and margin is always calculated exactly
+        """
+        self.extents = self.calculate_extents()  # 2 x 6 array, min and max of each axis
+        if cache_fname is None:
+            return
+        signature = self._signature(steps)
+        try:
+            cache = np.load(cache_fname)
+            if cache['signature'].shape == signature.shape and np.allclose(cache['signature'], signature):
+                self.grid = cache['grid']
+        except (IOError, KeyError, ValueError):
+            pass
+        if self.grid is None:
+            print "Building workspace grid with", steps ** 6, "poses"
+            self.grid = self._build_grid(steps)
+            try:
+                np.savez(cache_fname, signature=signature, grid=self.grid)
+            except IOError:
+                print "Unable to save workspace cache file:", cache_fname
+        self._lower = self.extents[0]
+        self._inverse_step_size = (steps - 1) / (self.extents[1] - self.extents[0])
+        self._max_index = steps - 1
+        self._axes = np.arange(6)
+        self._strides = np.array([steps ** (5 - i) for i in range(6)])
+        #  offsets of the 64 corners of a grid cell, used for interpolation
+        self._corners = (np.arange(64)[:, np.newaxis] >> np.arange(5, -1, -1)) & 1
+        self._corner_offsets = np.dot(self._corners, self._strides)
+
+    def margin(self, request):
+        """
+        returns the interpolated margin in mm of the given request
+
+        the margin is positive if reachable and negative if not
+        """
+        if self.grid is None:
+            return self.exact_margins(request)[0]
+        u = (np.asarray(request, dtype=float) - self._lower) * self._inverse_step_size
+        if u.min() < 0 or u.max() > self._max_index:
+            return self.exact_margins(request)[0]  # outside the grid
+        index = np.minimum(u.astype(int), self._max_index - 1)
+        fraction = u - index
+        #  weight of each corner is the product of (1 - fraction) or fraction along each axis
+        weights = np.array((1 - fraction, fraction))[self._corners, self._axes].prod(1)
+        values = self.grid.take(np.dot(index, self._strides) + self._corner_offsets)
+        return np.dot(weights, values)
+
+    def is_reachable(self, request):
+        return self.margin(request) >= 0
+
+    def exact_margins(self, requests):
+        """
+        returns numpy array of margins calculated with inverse kinematics for N x 6 requests
+        """
+        lengths = self.k.inverse_kinematics_batch(requests)
+        return np.min(np.minimum(lengths - self.min_actuator_len, self.max_actuator_len - lengths), 1)
+
+    def calculate_extents(self, iterations=30):
+        """
+        returns 2 x 6 numpy array of the min and max reachable value of each axis
+
+        found by bisection along each axis with the other axes at zero
+        """
+        bounds = np.array([MAX_TRANSLATION] * 3 + [MAX_ROTATION] * 3)
+        directions = np.vstack((-np.eye(6), np.eye(6)))  # 12 searches, negative then positive
+        lo = np.zeros(12)
+        hi = np.tile(bounds, 2)
+        for i in xrange(iterations):
+            mid = (lo + hi) / 2
+            reachable = self.exact_margins(directions * mid[:, np.newaxis]) >= 0
+            lo = np.where(reachable, mid, lo)
+            hi = np.where(reachable, hi, mid)
+        return np.vstack((-lo[:6], lo[6:]))
+
+    def get_1dof_limits(self):
+        """
+        returns list of the max movement in a single DOF reachable in both directions
+        """
+        return list(np.minimum(-self.extents[0], self.extents[1]))
+
+    def get_6dof_limits(self, iterations=20):
+        """
+        returns list of limits that are reachable in any combination of all 6 DOF
+
+        the single DOF limits are scaled down until all 64 combinations of extremes are reachable
+        """
+        limits = np.array(self.get_1dof_limits())
+        signs = 1 - 2 * ((np.arange(64)[:, np.newaxis] >> np.arange(6)) & 1)  # all combinations of +1/-1
+        lo = 0.0
+        hi = 1.0
+        for i in xrange(iterations):
+            mid = (lo + hi) / 2
+            if np.all(self.exact_margins(signs * limits * mid) >= 0):
+                lo = mid
+            else:
+                hi = mid
+        return list(limits * lo)
+
+    def _build_grid(self, steps, chunk_size=65536):
+        axes = [np.linspace(self.extents[0][i], self.extents[1][i], steps) for i in range(6)]
+        poses = np.array(np.meshgrid(*axes, indexing='ij')).reshape(6, -1).T  # row major over the axes
+        grid = np.empty(len(poses), dtype=np.float32)
+        for start in xrange(0, len(poses), chunk_size):
+            grid[start:start + chunk_size] = self.exact_margins(poses[start:start + chunk_size])
+        return grid
+
+    def _signature(self, steps):
+        #  values the grid depends on, a cached grid is only used if these match
+        return np.concatenate((self.k.base_pos.ravel(), self.k.platform_pos.ravel(),
+                               [self.k.platform_mid_height, self.min_actuator_len, self.max_actuator_len, steps]))
+
+
+class PoseLimiter(object):
+    """
+    moves requests that are not reachable back inside the workspace
+
+    Each request is first checked with the interpolated grid margin and only
+    checked exactly if that is less than exact_margin mm, so requests well
+    inside the workspace do not need inverse kinematics.
+    Orientation has priority: the translation is scaled towards the center
+    until the pose is reachable and the rotation is only scaled if the
+    orientation can't be reached with zero translation. The scale is found
+    with a bounded number of vectorized searches, starting around the scale
+    used in the previous frame.
+    """
+
+    def __init__(self, workspace, candidates=8, iterations=3, exact_margin=5.0):
+        self.workspace = workspace
+        self.exact_margin = exact_margin  # mm, must exceed the grid overestimate (see module docstring)
+        self.candidates = candidates  # poses evaluated in each search step
+        self.iterations = iterations
+        self.prev_scale = 1.0
+        self.is_limited = False  # True if the most recent request was not reachable
+
+    def limit(self, request):
+        """
+        returns request if reachable, otherwise the nearest reachable pose in the same direction
+        """
+        request = np.asarray(request, dtype=float)
+        margin = self.workspace.margin(request)
+        if margin < self.exact_margin:
+            margin = self.workspace.exact_margins(request)[0]  # near or outside the boundary
+        self.is_limited = margin < 0
+        if not self.is_limited:
+            self.prev_scale = 1.0
+            return request
+        #  scales above 1 are used for rotation, so prev_scale of 1.5 is rotation scaled by .5
+        translation = np.concatenate((request[:3], np.zeros(3)))
+        rotation = np.concatenate((np.zeros(3), request[3:]))
+        scale = self._largest_reachable_scale(lambda s: np.outer(s, translation) + rotation,
+                                              min(self.prev_scale, 1.0))
+        if scale is not None:
+            self.prev_scale = scale
+            return rotation + translation * scale
+        scale = self._largest_reachable_scale(lambda s: np.outer(s, rotation),
+                                              max(2.0 - self.prev_scale, 0.0))
+        if scale is None:
+            scale = 0.0
+        self.prev_scale = 2.0 - scale
+        return rotation * scale
+
+    def _largest_reachable_scale(self, make_poses, previous):
+        """
+        returns largest scale between 0 and 1 whose pose is reachable, or None
+
+        make_poses returns an array of poses for an array of scales
+        """
+        best = None
+        lo = max(previous - .25, 0.0)  # warm start search window
+        hi = min(previous + .25, 1.0)
+        for i in xrange(self.iterations):
+            scales = np.linspace(lo, hi, self.candidates)
+            reachable = np.flatnonzero(self.workspace.exact_margins(make_poses(scales)) >= 0)
+            if len(reachable) == 0:
+                if lo == 0:
+                    break  # nothing reachable
+                lo, hi = 0.0, lo
+            elif reachable[-1] == len(scales) - 1:
+                best = hi
+                if hi == 1.0:
+                    break
+                lo, hi = hi, 1.0
+            else:
+                best = scales[reachable[-1]]
+                lo, hi = best, scales[reachable[-1] + 1]
+        return best